@@ -0,0 +1,115 @@
+import sqlite3
+import json
+import time
+import os
+
+# ================= 設定區 =================
+# update_tool.py 與 app.py 共用的本機快取資料庫
+CACHE_DB = os.environ.get("GUILD_API_CACHE", "api_cache.db")
+# =========================================
+
+def _connect():
+    conn = sqlite3.connect(CACHE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS ocid_cache ("
+        " name TEXT PRIMARY KEY,"
+        " ocid TEXT NOT NULL,"
+        " updated_at REAL NOT NULL)"
+    )
+    # 每位成員上次成功更新的時間 (給增量更新模式用)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS fetch_log ("
+        " name TEXT PRIMARY KEY,"
+        " fetched_at REAL NOT NULL)"
+    )
+    # 網站即時查詢的角色基本資料 (status 為 ok / not_found，查無角色也會記下來)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS character_cache ("
+        " name TEXT PRIMARY KEY,"
+        " status TEXT NOT NULL,"
+        " data TEXT,"
+        " fetched_at REAL NOT NULL)"
+    )
+    return conn
+
+def get_ocid(name):
+    """查本機快取的 OCID，沒有就回傳 None"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT ocid FROM ocid_cache WHERE name = ?", (name,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def set_ocid(name, ocid):
+    """記住 暱稱 -> OCID (OCID 不會變，除非改名或刪角)"""
+    if not ocid:
+        return
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocid_cache (name, ocid, updated_at) VALUES (?, ?, ?)",
+                (name, ocid, time.time()),
+            )
+    finally:
+        conn.close()
+
+def invalidate_ocid(name):
+    """基本資料查詢失敗時呼叫：刪掉這筆 OCID，下次重新查 /id"""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM ocid_cache WHERE name = ?", (name,))
+    finally:
+        conn.close()
+
+def get_fetch_times(names):
+    """回傳 {暱稱: 上次更新的時間戳 (查詢成功或查無角色)}，從沒更新過的人不會出現在結果裡"""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT name, fetched_at FROM fetch_log").fetchall()
+    finally:
+        conn.close()
+    wanted = set(names)
+    return {name: ts for name, ts in rows if name in wanted}
+
+def mark_fetched(names, fetched_at=None):
+    """記錄這些成員剛剛更新過"""
+    fetched_at = fetched_at if fetched_at is not None else time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO fetch_log (name, fetched_at) VALUES (?, ?)",
+                [(name, fetched_at) for name in names],
+            )
+    finally:
+        conn.close()
+
+def get_character(name):
+    """查快取的角色基本資料，回傳 (狀態, 資料, 查詢時間戳)，沒有就回傳 None"""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT status, data, fetched_at FROM character_cache WHERE name = ?", (name,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    status, data, fetched_at = row
+    return status, (json.loads(data) if data else None), fetched_at
+
+def set_character(name, status, data):
+    """記住角色基本資料查詢結果 (成功、查無角色或暫時失敗；過期時間由 nexon_client 判斷)"""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO character_cache (name, status, data, fetched_at) VALUES (?, ?, ?, ?)",
+                (name, status, json.dumps(data, ensure_ascii=False) if data is not None else None, time.time()),
+            )
+    finally:
+        conn.close()
@@ -3,13 +3,27 @@ import pandas as pd
 import plotly.express as px
 import datetime
 import numpy as np
-import requests
+import nexon_client
+import guild_store
+import guild_compute
+import guild_db
+import image_store
+import os
+import uuid
+import perf_trace
 
 # ==========================================
 # 頁面設定 (必須在第一行)
 # ==========================================
 st.set_page_config(page_title="公會每周統計", page_icon="🍁", layout="wide")
 
+# ==========================================
+# 效能分析：記錄每次 rerun 各階段耗時 (寫入 profile_logs/<session>.jsonl)
+# ==========================================
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:12]
+profiler = perf_trace.RerunProfiler(st.session_state.session_id)
+
 # ==========================================
 # [新增] 全域 CSS 樣式：定義彩虹文字特效 & 滾動鎖定
 # ==========================================
@@ -47,6 +61,16 @@ st.markdown("""
 # API 串接設定
 # ==========================================
 API_KEY = st.secrets.get("NEXON_API_KEY", None)
+# 資料來源："file" = guild_data.parquet / csv (預設)；"sqlite" = update_tool --database 產生的 guild_data.db；
+# "partitioned" = update_tool --partitions 產生的依月分割檔 (guild_data_parts/)
+# 資料庫與分割模式都只讀取選取區間的資料 (資料庫模式的排名彙總直接在 SQLite 裡計算)
+GUILD_BACKEND = st.secrets.get("GUILD_BACKEND", "file")
+USE_DATABASE = GUILD_BACKEND == "sqlite" and os.path.exists(guild_db.DB_FILE)
+USE_PARTITIONS = GUILD_BACKEND == "partitioned" and os.path.exists(os.path.join(guild_store.PARTITION_DIR, guild_store.PARTITION_MANIFEST))
+# 依區間載入的模式，日期選單預設只看最近幾周 (保持預設畫面很快，不管保存了幾個賽季)
+DEFAULT_RECENT_WEEKS = 12
+# 管理員金鑰：網址加上 ?admin=<金鑰> 才會在側邊欄顯示效能分析面板
+ADMIN_KEY = st.secrets.get("ADMIN_KEY", None)
 
 # ==========================================
 # 全域設定：圖表工具列與互動鎖定
@@ -67,38 +91,25 @@ PLOT_CONFIG = {
     }
 }
 
-@st.cache_data(ttl=600)
-def get_maple_character_info(character_name):
+def character_info_date():
+    # 角色資料查「昨天」的 (當天的資料 Nexon 還在準備)
+    return (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+
+def get_maple_character_info(character_name, limiter=None):
     if not API_KEY:
         return None, "未設定 API Key"
     
-    headers = {
-        "x-nxopen-api-key": API_KEY,
-        "accept": "application/json"
-    }
+    # 查詢結果存在本機 SQLite (所有 session 與重啟後都共用)：舊資料先回傳、背景再更新
+    # OCID 快取、連線共用與 429 / 5xx 重試都由 nexon_client 處理
+    status, data = nexon_client.get_character_basic_cached(character_name, API_KEY, limiter=limiter, date=character_info_date())
     
-    try:
-        # 1. 取得 OCID
-        url_id = "https://open.api.nexon.com/maplestorytw/v1/id"
-        resp_id = requests.get(url_id, headers=headers, params={"character_name": character_name})
-        
-        if resp_id.status_code != 200:
-            return None, "找不到角色或 API 額度不足"
-        
-        ocid = resp_id.json().get("ocid")
-        
-        # 2. 取得角色基本資料
-        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        url_basic = "https://open.api.nexon.com/maplestorytw/v1/character/basic"
-        resp_basic = requests.get(url_basic, headers=headers, params={"ocid": ocid, "date": yesterday})
-        
-        if resp_basic.status_code == 200:
-            return resp_basic.json(), None
-        else:
-            return None, "無法讀取角色資料"
-            
-    except Exception as e:
-        return None, f"連線錯誤: {e}"
+    if status == nexon_client.OK:
+        return data, None
+    elif status == nexon_client.NOT_FOUND:
+        return None, "找不到角色"
+    else:
+        # 暫時性失敗只短暫記住 (nexon_client.FAILED_TTL)，之後會重新查詢
+        return None, f"API 忙碌或連線錯誤，請稍後再試 ({data})"
 
 # ==========================================
 # 0. 職業階層定義
@@ -207,30 +218,249 @@ if not check_password():
 # ==========================================
 # 2. 讀取與處理資料
 # ==========================================
-@st.cache_data(ttl=600)
-def load_data():
-    df = pd.read_csv("guild_data.csv")
-    
-    df.dropna(how='all', inplace=True)
-    df.dropna(subset=['職業'], inplace=True)
-    df['職業'] = df['職業'].astype(str)
-    df['暱稱'] = df['暱稱'].astype(str)
-    
-    df['周次'] = pd.to_datetime(df['周次'])
-    df['旗幟戰'] = pd.to_numeric(df['旗幟戰'], errors='coerce').fillna(0)
-    df['地下水道'] = pd.to_numeric(df['地下水道'], errors='coerce').fillna(0)
-    df['公會城每周'] = pd.to_numeric(df['公會城每周'], errors='coerce').fillna(0)
-    
-    df['本周是否達成'] = df['本周是否達成'].astype(str).str.strip()
-    
-    return df
+@st.cache_resource
+def get_data_source():
+    # 所有 session 共用一個資料來源：記住上次讀到哪裡，檔案沒變就不重讀、只新增資料列就只讀新的部分
+    # 優先讀 update_tool 產生的 Parquet (型別已整理好)，沒有才讀 CSV 並轉型
+    return guild_store.GuildDataSource()
+
+@st.cache_resource(max_entries=2)
+def load_data(_raw_df, version):
+    # 依資料版本快取 (不再固定 10 分鐘重讀)：update_tool 一更新檔案，下一次重新整理就看得到
+    # 用 cache_resource：每次 rerun 直接拿同一份物件，不必把整份資料與索引序列化再複製 (這些物件只讀不改)
+    df = _raw_df
+    # 依周次排序，日期區間可以直接用二分搜尋切片
+    df = guild_compute.sort_by_week(df)
+    time_index = guild_compute.TimeIndex(df)
+    # 玩家 × 周次前綴和：任何日期區間的總和只要查兩次表，不必每次 groupby 全部歷史
+    cube = guild_compute.WeekCube(df)
+    # 職業 -> 玩家、玩家 -> 資料列 的查詢索引，選單與個人資料都直接查表
+    lookups = guild_compute.LookupIndex(df)
+    return df, cube, lookups, time_index
+
+@st.cache_data(max_entries=4)
+def get_db_overview(version):
+    # 資料庫模式：周次清單與玩家選單只查索引，不載入資料列
+    all_players, players_by_job = guild_db.player_directory()
+    return guild_db.list_weeks(), all_players, players_by_job
+
+@st.cache_resource(max_entries=8)
+def load_period_from_db(version, start_date, end_date):
+    # 資料庫模式：只讀取選取區間的資料列，記憶體與載入時間跟著區間大小走
+    df = guild_db.read_period(start_date, end_date)
+    return df, guild_compute.LookupIndex(df), guild_compute.TimeIndex(df)
+
+@st.cache_data(max_entries=32)
+def load_player_from_db(version, player, start_date, end_date):
+    # 資料庫模式的個人查詢：單一玩家的資料列很少，直接查 (暱稱, 周次) 索引
+    return guild_db.read_player(player, start_date, end_date)
+
+@st.cache_resource
+def get_partition_source():
+    # 分割模式：已載入的分割留在記憶體，所有 session 共用；區間變大時才載入新的分割
+    return guild_store.PartitionedGuildData()
+
+@st.cache_resource(max_entries=8)
+def load_partitions(version, part_keys):
+    # 只讀取與日期區間重疊的分割 (依 manifest 的最小 / 最大周次判斷)
+    df = guild_compute.sort_by_week(get_partition_source().read(part_keys))
+    return df, guild_compute.WeekCube(df), guild_compute.LookupIndex(df), guild_compute.TimeIndex(df)
 
 try:
-    df = load_data()
+    # 資料版本代號由檔案內容產生：檔案更新後代號改變，下游的快取就會自動失效
+    with profiler.span("load_data"):
+        if USE_DATABASE:
+            data_version = guild_db.data_version()
+            all_weeks, all_players_list, players_by_job = get_db_overview(data_version)
+            data_min_date, data_max_date = all_weeks[0], all_weeks[-1]
+        elif USE_PARTITIONS:
+            data_version = get_partition_source().refresh()
+            data_min_date, data_max_date = get_partition_source().date_bounds()
+            if data_min_date is None:
+                # manifest 沒有任何分割：和其他模式讀不到資料一樣，顯示「讀取資料失敗」後停止
+                raise ValueError(f"{guild_store.PARTITION_DIR} 裡沒有任何分割資料，請先執行 update_tool.py --partitions")
+            all_players_list, players_by_job = get_partition_source().players()
+        else:
+            data_version, raw_df = get_data_source().refresh()
+            df, week_cube, lookups, time_index = load_data(raw_df, data_version)
+            # 所有出現過的周次 (已排序)，日期選單的上下限直接取頭尾
+            data_min_date, data_max_date = time_index.weeks[0], time_index.weeks[-1]
+            all_players_list, players_by_job = lookups.all_players, lookups.players_by_job
 except Exception as e:
     st.error(f"讀取資料失敗: {e}")
     st.stop()
 
+@st.cache_resource(max_entries=64)
+def get_guild_ranking(_cube, version, start_date, end_date):
+    # 依 (資料版本, 開始日, 結束日) 快取全公會排名，所有使用者與兩種檢視共用
+    # 排名表與名次索引都只讀不改，用 cache_resource 才不會每次 rerun 都反序列化一份 (成本會隨公會人數增加)
+    if USE_DATABASE:
+        # 資料庫模式：GROUP BY 直接在 SQLite 裡算 (用 周次 索引只掃區間內的列)
+        return guild_db.guild_ranking(start_date, end_date)
+    return guild_compute.guild_ranking(_cube, start_date, end_date)
+
+@st.cache_resource(max_entries=64)
+def get_rank_indexes(_cube, version, start_date, end_date):
+    # 三項活動的名次索引 (排序一次，之後查前後名次都是直接取位置)
+    return guild_compute.build_rank_indexes(get_guild_ranking(_cube, version, start_date, end_date))
+
+@st.cache_resource(max_entries=4)
+def get_search_index(_df, version):
+    # 每個資料版本只建一次；cache_resource 不複製物件，打字搜尋時不用重新序列化整份索引
+    return guild_compute.SearchIndex(_df)
+
+def image_manifest_version():
+    # 圖庫清單的修改時間，update_tool 同步圖片後快取就會更新
+    return os.path.getmtime(image_store.MANIFEST_FILE) if os.path.exists(image_store.MANIFEST_FILE) else 0
+
+@st.cache_data(max_entries=4)
+def get_image_manifest(version):
+    return image_store.load_manifest()
+
+def get_image_path(url):
+    # 圖片網址 -> 本機縮圖路徑，圖庫沒有就回傳 None
+    return image_store.local_image(url, get_image_manifest(image_manifest_version()))
+
+@st.cache_data(max_entries=512)
+def _image_data_uri(path):
+    return image_store.data_uri(path)
+
+def get_image_src(url):
+    # 圖片網址 -> 本機縮圖的靜態檔案網址 (瀏覽器會快取，fragment 每次更新也只送網址)
+    # 舊圖庫不在 static/ 底下的才內嵌 data URI；圖庫沒有就用原本的網址
+    path = get_image_path(url)
+    if not path:
+        return url
+    return image_store.static_url(path) or _image_data_uri(path)
+
+@st.cache_resource(max_entries=4)
+def get_change_log(_df, version):
+    # 全公會升降階紀錄與備註每個資料版本整批算一次，個人分頁只做切片
+    return guild_compute.ChangeLog(_df)
+
+# 個人趨勢圖一周一點，5 年也只有約 260 點，門檻依實際序列長度設定：
+# - 超過 MAX_PLOT_POINTS (約 3 年) 就降採樣，每段保留最高與最低 (尖峰不會消失)
+# - 畫面上的總點數 (點數 × 線條數，地下水道多一條趨勢線) 超過 WEBGL_POINT_THRESHOLD 改用 WebGL
+MAX_PLOT_POINTS = 156
+WEBGL_POINT_THRESHOLD = 250
+
+@st.cache_data(max_entries=128)
+def build_trend_figure(_df_filtered, final_selected_player, chart_type, line_color, y_label, start_date, end_date, version):
+    df_filtered = _df_filtered
+    # 點數很多時對畫面上的點降採樣並改用 WebGL 繪製 (趨勢線與平均仍用完整資料計算)
+    plot_rows = guild_compute.downsample_indices(df_filtered[chart_type].to_numpy(), MAX_PLOT_POINTS)
+    df_plot = df_filtered.iloc[plot_rows]
+    n_traces = 2 if chart_type == "地下水道" and len(df_filtered) > 1 else 1
+    use_webgl = len(plot_rows) * n_traces > WEBGL_POINT_THRESHOLD
+
+    fig_line = px.line(df_plot, x='周次', y=chart_type, title=f"{final_selected_player} - {chart_type} 趨勢", markers=True, render_mode='webgl' if use_webgl else 'auto')
+    fig_line.update_traces(line_color=line_color, line_width=3, marker_size=6, marker_color=line_color, name="實際分數")
+
+    if chart_type == "地下水道" and len(df_filtered) > 1:
+        try:
+            # --- 修改開始 ---
+            # 1. 將日期轉換為「距離第一天的天數」，這樣算出來的斜率單位就是「分/天」
+            base_date = df_filtered['周次'].min()
+            x_days = (df_filtered['周次'] - base_date).dt.days
+            y_scores = df_filtered[chart_type]
+            
+            # 2. 計算線性回歸 (1代表一次方程式 y = ax + b)
+            slope_daily, intercept = np.polyfit(x_days, y_scores, 1)
+            
+            # 3. 將「每天進步」轉換為「每週進步」(乘以 7)
+            slope_weekly = slope_daily * 7
+            
+            # 4. 計算趨勢線的 Y 軸數值
+            y_trend = slope_daily * x_days + intercept
+            
+            # 5. 設定顯示文字 (加上正負號與千分位逗號)
+            trend_label = f'📈 趨勢 (週成長: {int(slope_weekly):+,})'
+            
+            fig_line.add_scatter(
+                x=df_filtered['周次'].iloc[plot_rows], 
+                y=np.asarray(y_trend)[plot_rows], 
+                mode='lines', 
+                name=trend_label, # 這裡會顯示計算出來的斜率
+                line=dict(color='red', width=2, dash='dash'), 
+                hoverinfo='name+y'
+            )
+            # --- 修改結束 ---
+        except Exception as e:
+            pass
+
+    avg_score = df_filtered[chart_type].mean()
+    if chart_type != "公會城每周" and avg_score > 0:
+        fig_line.add_hline(y=avg_score, line_dash="dot", line_color="gray", annotation_text=f"平均: {int(avg_score):,}", annotation_position="bottom right")
+
+    fig_line.update_layout(
+        xaxis=dict(tickformat="%Y-%m-%d", fixedrange=True),
+        yaxis=dict(title=y_label, fixedrange=True),
+        hovermode="x unified",
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        dragmode=False 
+    )
+
+    return fig_line
+
+@st.cache_data(max_entries=64)
+def build_top15_figure(_top15_df, col_name, color_scale, label_name, start_date, end_date, version):
+    # 排行榜 Top 15 長條圖，依 (活動, 日期區間, 資料版本) 快取
+    fig = px.bar(_top15_df, x=col_name, y='暱稱', orientation='h', text=col_name, title=f"🏆 {label_name} Top 15", color=col_name, color_continuous_scale=color_scale)
+    fig.update_layout(yaxis={'categoryorder':'total ascending', 'fixedrange': True}, xaxis={'fixedrange': True}, dragmode=False)
+    fig.update_traces(texttemplate='%{text:,}', textposition='outside')
+    return fig
+
+# 排行榜即時資料預先查詢：每個排行榜的前幾名、同時幾個查詢、每秒幾次、還有沒查完的每幾秒補一次畫面
+LIVE_TOP_N = 15
+LIVE_PREFETCH_WORKERS = 4
+LIVE_RATE_LIMIT_PER_SEC = 5
+LIVE_POLL_SECONDS = 2
+
+@st.cache_resource
+def get_live_limiter():
+    return nexon_client.TokenBucket(LIVE_RATE_LIMIT_PER_SEC, capacity=1)
+
+@st.cache_resource
+def get_live_prefetcher():
+    # 所有 session 共用同一組執行緒與限速器，同一個角色正在查就不重複送出
+    limiter = get_live_limiter()
+
+    def fetch(name):
+        data, _ = get_maple_character_info(name, limiter)
+        return data
+
+    return nexon_client.Prefetcher(fetch, LIVE_PREFETCH_WORKERS)
+
+def prefetch_live_info(names):
+    """有可用快取的直接取用，其餘排入背景查詢，回傳 ({暱稱: 資料}, {暱稱: future})；沒設定 API Key 就不查"""
+    if not API_KEY:
+        return {}, {}
+    ready, missing = {}, []
+    for name in names:
+        cached = nexon_client.peek_character_basic(name, API_KEY, get_live_limiter(), character_info_date())
+        if cached is None:
+            missing.append(name)
+        elif cached[0] == nexon_client.OK:
+            ready[name] = cached[1]
+    return ready, get_live_prefetcher().submit(missing)
+
+def collect_live_info(ready, futures):
+    """快取的資料加上已經查完的 (不等待)，回傳 ({暱稱: 資料}, 是否還有查詢中的)"""
+    results = dict(ready)
+    pending = False
+    for name, future in futures.items():
+        if not future.done():
+            pending = True
+            continue
+        data = future.result()
+        if data:
+            results[name] = data
+    return results, pending
+
+# 個人卡片上顯示前後各幾位玩家
+NEIGHBOR_COUNT = 1
+
 # ==========================================
 # 3. 介面與搜尋邏輯
 # ==========================================
@@ -238,15 +468,17 @@ st.title("🍁 公會每周統計")
 
 st.sidebar.header("📅 日期區間設定")
 
-data_min_date = df['周次'].min().date()
-data_max_date = df['周次'].max().date()
+if USE_DATABASE or USE_PARTITIONS:
+    default_start_date = max(data_min_date, data_max_date - datetime.timedelta(weeks=DEFAULT_RECENT_WEEKS))
+else:
+    default_start_date = data_min_date
 
 col_start, col_end = st.sidebar.columns(2)
 
 with col_start:
     start_date = st.date_input(
         "開始日期",
-        value=data_min_date,      
+        value=default_start_date,      
         min_value=data_min_date,
         max_value=data_max_date,
         format="YYYY-MM-DD"        
@@ -264,8 +496,23 @@ with col_end:
 if start_date > end_date:
     st.sidebar.error("⚠️ 「開始日期」不能晚於「結束日期」")
 
-mask_period = (df['周次'].dt.date >= start_date) & (df['周次'].dt.date <= end_date)
-df_period = df[mask_period]
+if USE_DATABASE:
+    # 資料庫模式：只載入選取區間；下游以資料框為基礎的快取也要分區間
+    with profiler.span("load_data"):
+        df, lookups, time_index = load_period_from_db(data_version, start_date, end_date)
+    week_cube = None
+    data_version = f"{data_version}:{start_date}:{end_date}"
+elif USE_PARTITIONS:
+    # 分割模式：只載入與區間重疊的分割；下游快取依載入的分割組合區分
+    with profiler.span("load_data"):
+        part_keys = get_partition_source().overlapping(start_date, end_date)
+        df, week_cube, lookups, time_index = load_partitions(data_version, part_keys)
+    data_version = f"{data_version}:{','.join(part_keys)}"
+
+# 資料已依周次排序：二分搜尋找出區間頭尾，直接切片 (不必把整欄日期轉成 date 逐列比較)
+with profiler.span("df_period"):
+    df_period = time_index.slice(df, start_date, end_date)
+st.sidebar.caption(f"📆 區間內共 {time_index.count_weeks(start_date, end_date)} 週資料")
 
 st.markdown("### 🔍 功能面板")
 
@@ -282,24 +529,22 @@ if search_mode == "全公會排行榜":
     st.markdown("---")
     st.markdown(f"### 📊 公會排行榜 ({start_date} ~ {end_date})")
     
-    leaderboard_df = df_period.groupby('暱稱').agg({
-        '旗幟戰': 'sum',
-        '地下水道': 'sum',
-        '公會城每周': 'sum',
-        '周次': 'nunique',
-        '職業': 'first',
-        '圖片': 'first'
-    }).reset_index()
+    # 共用的全公會排名表 (前綴和矩陣算出區間總和，依日期區間快取)
+    with profiler.span("leaderboard_ranking"):
+        leaderboard_df = get_guild_ranking(week_cube, data_version, start_date, end_date)
     
-    tab_rank_flag, tab_rank_water, tab_rank_castle = st.tabs(["🚩 旗幟戰排行", "💧 地下水道排行", "🏰 公會城全勤榜"])
+    # 只渲染目前選中的排行 (st.tabs 會把三個分頁全部算完才送出)
+    rank_tabs = ["🚩 旗幟戰排行", "💧 地下水道排行", "🏰 公會城全勤榜", "⚖️ 本周升降階"]
+    selected_rank_tab = st.radio("排行榜分頁", rank_tabs, horizontal=True, label_visibility="collapsed", key="rank_tab")
     
     def draw_leaderboard(data, col_name, color_scale, label_name, is_attendance=False):
-        sorted_df = data.sort_values(by=col_name, ascending=False).reset_index(drop=True)
-        sorted_df['名次'] = sorted_df.index + 1
+        sorted_df = guild_compute.leaderboard_table(data, col_name)
         
         def get_img_tag(url, width=150):
             if url and str(url) != "nan" and str(url).strip() != "":
-                return f'<img src="{url}" style="width: {width}px; height: auto; border-radius: 8px; object-fit: contain; margin: 5px 0; box-shadow: 0 2px 4px rgba(0,0,0,0.3);">'
+                # 本機圖庫有這張圖就內嵌縮圖，沒有才連到官方 CDN
+                src = get_image_src(url)
+                return f'<img src="{src}" style="width: {width}px; height: auto; border-radius: 8px; object-fit: contain; margin: 5px 0; box-shadow: 0 2px 4px rgba(0,0,0,0.3);">'
             return ""
 
         # 使用單行 CSS 並放大字體
@@ -335,72 +580,120 @@ if search_mode == "全公會排行榜":
             </div>
         """
 
-        cols = st.columns([0.9, 1.1, 1.3, 1.1, 0.9])
+        # 前 N 名的即時資料先排入背景查詢 (已有快取的會馬上完成)
+        live_ready, live_futures = prefetch_live_info(sorted_df['暱稱'].head(LIVE_TOP_N).astype(str))
+
+        # 畫面先用已經查完的資料畫出來；還有沒查完的，頒獎台和完整名單用 fragment 定時自己補上，不擋住整頁
+        _, live_pending = collect_live_info(live_ready, live_futures)
+        live_refresh = LIVE_POLL_SECONDS if live_pending else None
         spacer_mid = 3 
         spacer_low = 6 
 
-        # 排行榜前五名顯示邏輯
-        with cols[0]:
-            if len(sorted_df) > 3:
-                p = sorted_df.iloc[3]
-                for _ in range(spacer_low): st.write("")
-                st.markdown(style_4th5th.format(
-                    icon="4️⃣", img_tag=get_img_tag(p.get('圖片'), width=110), 
-                    name=p['暱稱'], score_label="分數", score=f"{int(p[col_name]):,}", color="#4D96FF"
-                ), unsafe_allow_html=True)
-        with cols[1]:
-            if len(sorted_df) > 1:
-                p = sorted_df.iloc[1]
-                for _ in range(spacer_mid): st.write("")
-                st.markdown(style_2nd3rd.format(
-                    icon="🥈", img_tag=get_img_tag(p.get('圖片'), width=130), 
-                    name=p['暱稱'], score_label="分數", score=f"{int(p[col_name]):,}", 
-                    color="#C0C0C0", border_color="#C0C0C0"
-                ), unsafe_allow_html=True)
-        with cols[2]:
-            if len(sorted_df) > 0:
-                p = sorted_df.iloc[0]
-                st.markdown(style_1st.format(
-                    icon="🥇", img_tag=get_img_tag(p.get('圖片'), width=150), 
-                    name=p['暱稱'], score_label="分數", score=f"{int(p[col_name]):,}", color="#FFD700"
-                ), unsafe_allow_html=True)
-        with cols[3]:
-            if len(sorted_df) > 2:
-                p = sorted_df.iloc[2]
-                for _ in range(spacer_mid): st.write("")
-                st.markdown(style_2nd3rd.format(
-                    icon="🥉", img_tag=get_img_tag(p.get('圖片'), width=130), 
-                    name=p['暱稱'], score_label="分數", score=f"{int(p[col_name]):,}", 
-                    color="#CD7F32", border_color="#CD7F32"
-                ), unsafe_allow_html=True)
-        with cols[4]:
-            if len(sorted_df) > 4:
-                p = sorted_df.iloc[4]
-                for _ in range(spacer_low): st.write("")
-                st.markdown(style_4th5th.format(
-                    icon="5️⃣", img_tag=get_img_tag(p.get('圖片'), width=110), 
-                    name=p['暱稱'], score_label="分數", score=f"{int(p[col_name]):,}", color="#4D96FF"
-                ), unsafe_allow_html=True)
+        def podium_card(rank, template, icon, width, live=None, **kwargs):
+            p = sorted_df.iloc[rank]
+            img_url, name = p.get('圖片'), p['暱稱']
+            if live:
+                # 有即時資料就換成目前的角色圖片並標上等級
+                img_url = live.get('character_image') or img_url
+                name = f"{name} <span style=\"font-size: 0.7em; color: #AAA;\">Lv.{live.get('character_level', '?')}</span>"
+            return template.format(
+                icon=icon, img_tag=get_img_tag(img_url, width=width),
+                name=name, score_label="分數", score=f"{int(p[col_name]):,}", **kwargs
+            )
+
+        @st.fragment(run_every=live_refresh)
+        def show_podium():
+            live_info, _ = collect_live_info(live_ready, live_futures)
+            cols = st.columns([0.9, 1.1, 1.3, 1.1, 0.9])
+
+            def show_card(rank, template, icon, width, **kwargs):
+                live = live_info.get(str(sorted_df.iloc[rank]['暱稱']))
+                st.markdown(podium_card(rank, template, icon, width, live=live, **kwargs), unsafe_allow_html=True)
+
+            # 排行榜前五名顯示邏輯
+            with cols[0]:
+                if len(sorted_df) > 3:
+                    for _ in range(spacer_low): st.write("")
+                    show_card(3, style_4th5th, "4️⃣", 110, color="#4D96FF")
+            with cols[1]:
+                if len(sorted_df) > 1:
+                    for _ in range(spacer_mid): st.write("")
+                    show_card(1, style_2nd3rd, "🥈", 130, color="#C0C0C0", border_color="#C0C0C0")
+            with cols[2]:
+                if len(sorted_df) > 0:
+                    show_card(0, style_1st, "🥇", 150, color="#FFD700")
+            with cols[3]:
+                if len(sorted_df) > 2:
+                    for _ in range(spacer_mid): st.write("")
+                    show_card(2, style_2nd3rd, "🥉", 130, color="#CD7F32", border_color="#CD7F32")
+            with cols[4]:
+                if len(sorted_df) > 4:
+                    for _ in range(spacer_low): st.write("")
+                    show_card(4, style_4th5th, "5️⃣", 110, color="#4D96FF")
+
+        with profiler.span("podium_cards"):
+            show_podium()
 
         st.markdown("---")
         
         top15_df = sorted_df.head(15).copy()
-        fig = px.bar(top15_df, x=col_name, y='暱稱', orientation='h', text=col_name, title=f"🏆 {label_name} Top 15", color=col_name, color_continuous_scale=color_scale)
-        fig.update_layout(yaxis={'categoryorder':'total ascending', 'fixedrange': True}, xaxis={'fixedrange': True}, dragmode=False)
-        fig.update_traces(texttemplate='%{text:,}', textposition='outside')
-        st.plotly_chart(fig, use_container_width=True, config=PLOT_CONFIG)
-        
+        with profiler.span("figure_top15"):
+            fig = build_top15_figure(top15_df, col_name, color_scale, label_name, start_date, end_date, data_version)
+            st.plotly_chart(fig, use_container_width=True, config=PLOT_CONFIG)
+
         st.markdown("#### 📋 完整名單")
-        display_df = sorted_df[['名次', '暱稱', '職業', '周次', col_name]].copy()
         val_format = "%d 次" if is_attendance else "%d"
-        st.dataframe(display_df, use_container_width=True, hide_index=True, column_config={col_name: st.column_config.ProgressColumn(label_name, format=val_format, min_value=0, max_value=int(sorted_df[col_name].max()) if len(sorted_df) > 0 else 100,), "名次": st.column_config.NumberColumn(format="No. %d")})
 
-    with tab_rank_flag:
+        @st.fragment(run_every=live_refresh)
+        def show_full_list():
+            display_df = sorted_df[['名次', '暱稱', '職業', '周次', col_name]].copy()
+            live_info, still_pending = collect_live_info(live_ready, live_futures)
+            if API_KEY:
+                # 前 N 名附上目前等級 (查詢中、查不到的先留空)
+                display_df.insert(3, '目前等級', display_df['暱稱'].astype(str).map(lambda n: live_info.get(n, {}).get('character_level')))
+            st.dataframe(display_df, use_container_width=True, hide_index=True, column_config={col_name: st.column_config.ProgressColumn(label_name, format=val_format, min_value=0, max_value=int(sorted_df[col_name].max()) if len(sorted_df) > 0 else 100,), "名次": st.column_config.NumberColumn(format="No. %d")})
+            # 全部查完就整頁重跑一次：結果都在快取裡了，新的 fragment 不會再定時更新
+            # (同一個排行榜只重跑一次，避免查詢一直出錯時不停重跑)
+            live_key = (col_name, str(start_date), str(end_date), data_version)
+            if live_refresh and not still_pending and st.session_state.get('live_rerun_key') != live_key:
+                st.session_state.live_rerun_key = live_key
+                st.rerun()
+
+        with profiler.span("full_list"):
+            show_full_list()
+
+    if selected_rank_tab == rank_tabs[0]:
         draw_leaderboard(leaderboard_df, '旗幟戰', 'Reds', '旗幟戰分數')
-    with tab_rank_water:
+    elif selected_rank_tab == rank_tabs[1]:
         draw_leaderboard(leaderboard_df, '地下水道', 'Blues', '地下水道分數')
-    with tab_rank_castle:
+    elif selected_rank_tab == rank_tabs[2]:
         draw_leaderboard(leaderboard_df, '公會城每周', 'Greens', '公會城參與數', is_attendance=True)
+    elif selected_rank_tab == rank_tabs[3]:
+        # 全公會升降階名單：預設顯示區間內最後一週，也可以選其他週
+        with profiler.span("change_log"):
+            change_engine = get_change_log(df, data_version)
+        latest_week = change_engine.latest_week(start_date, end_date)
+        if latest_week is None:
+            st.info("此日期區間內沒有任何「升階」或「降階」的紀錄。")
+        else:
+            weeks_in_range = [w for w in time_index.weeks if start_date <= w <= end_date][::-1]
+            report_week = st.selectbox("選擇周次", weeks_in_range, index=weeks_in_range.index(latest_week.date()), format_func=lambda d: d.strftime("%Y-%m-%d"))
+            report = change_engine.week_report(pd.Timestamp(report_week))
+            col_up, col_down = st.columns(2)
+            for col, kind, icon in [(col_up, '升階', '⬆️'), (col_down, '降階', '⬇️')]:
+                with col:
+                    kind_df = report[kind]
+                    st.markdown(f"#### {icon} {kind} ({len(kind_df)} 人)")
+                    if kind_df.empty:
+                        st.caption(f"本週沒有{kind}的成員")
+                    else:
+                        st.dataframe(
+                            kind_df[['暱稱', '職業', '貢獻活動', '備註']].style.apply(
+                                lambda d, css=guild_compute.CHANGE_STYLES[kind]: pd.DataFrame(css, index=d.index, columns=d.columns), axis=None),
+                            use_container_width=True,
+                            hide_index=True,
+                            column_config={"備註": st.column_config.TextColumn("備註", width="large")}
+                        )
 
 # ==========================================
 # 分支 B: 原始資料查詢 (新增的功能)
@@ -410,12 +703,13 @@ elif search_mode == "原始資料查詢":
     st.markdown("### 原始資料庫搜尋")
     
     # 1. 搜尋框
-    search_query = st.text_input("🔍 請輸入關鍵字 (搜尋暱稱、職業、分數、達成狀態...)", placeholder="例如: 陰陽師, 1000, 達成...")
+    search_query = st.text_input("🔍 請輸入關鍵字 (搜尋暱稱、職業、分數、達成狀態...，結尾加 * 只比對開頭)", placeholder="例如: 陰陽師, 1000, 達成, Blaze*...")
     
     # 2. 篩選邏輯
     if search_query:
-        # 將資料轉為文字，檢查是否包含關鍵字 (case=False 不分大小寫)
-        mask = df_period.astype(str).apply(lambda x: x.str.contains(search_query, case=False, na=False)).any(axis=1)
+        # 用預先建好的索引搜尋 (不分大小寫)，只掃日期區間內的列
+        with profiler.span("search"):
+            mask = get_search_index(df, data_version).search(search_query, df_period.index)
         df_display = df_period[mask]
         st.success(f"🔍 搜尋結果：共找到 {len(df_display)} 筆資料")
     else:
@@ -476,7 +770,7 @@ else:
                     st.selectbox("3️⃣ 職業", [], disabled=True, placeholder="請先選分類")
             with col_player:
                 if selected_job:
-                    players_in_job = sorted(df[df['職業'] == selected_job]['暱稱'].unique().tolist())
+                    players_in_job = players_by_job.get(selected_job, [])
                     if not players_in_job:
                         st.warning("無數據")
                         final_selected_player = None
@@ -488,42 +782,35 @@ else:
             col_search_1, col_search_2 = st.columns([1, 3])
             with col_search_1: st.markdown("**🔎 搜尋玩家**")
             with col_search_2:
-                all_players_list = sorted(df['暱稱'].unique().tolist())
                 final_selected_player = st.selectbox("請輸入或選擇玩家 ID：", all_players_list, index=None, placeholder="輸入玩家 ID...")
 
     if not final_selected_player:
         st.markdown("---")
         st.info("👋 請在上方選擇一位玩家以查看詳細數據。")
     else:
-        df_filtered = df_period[df_period['暱稱'] == final_selected_player]
+        # 直接取出該玩家在區間內的資料列 (已依周次排序)，不必掃描整個區間
+        with profiler.span("player_rows"):
+            if USE_DATABASE:
+                # 資料庫模式：用 (暱稱, 周次) 索引只查這位玩家
+                df_filtered = load_player_from_db(data_version, final_selected_player, start_date, end_date)
+            else:
+                df_filtered = df.iloc[lookups.player_rows(final_selected_player, start_date, end_date)]
 
         if len(df_filtered) == 0:
             st.warning(f"玩家 {final_selected_player} 在此日期區間內無資料。")
         else:
-            df_sorted = df_filtered.sort_values('周次', ascending=False)
-            player_info = df_sorted.iloc[0]
-            current_level = player_info.get('等級', 0)
-            img_url = player_info.get('圖片', None)
-
-            if pd.to_numeric(current_level, errors='coerce') == 0 or pd.isna(current_level):
-                valid_rows = df_sorted[pd.to_numeric(df_sorted['等級'], errors='coerce') > 0]
-                if not valid_rows.empty:
-                    player_info = valid_rows.iloc[0] 
-                    current_level = player_info.get('等級')
-                    img_url = player_info.get('圖片')
-
-            if str(current_level) == "0" or str(current_level) == "nan": display_level = "???"
-            else: display_level = int(float(current_level)) 
-
-            job_display = player_info.get('職業', '未知')
-            if str(job_display) == 'nan': job_display = '未知'
+            # 最新的職業 / 等級 / 圖片 (等級是 0 就往前找)
+            profile = guild_compute.player_profile(df_filtered)
+            img_url = profile['圖片']
+            display_level = "???" if profile['等級'] is None else profile['等級']
+            job_display = profile['職業']
 
             st.markdown(f"## 👤 {final_selected_player} 的個人數據報告")
 
             with st.container(border=True):
                 col_profile_img, col_profile_info = st.columns([1.5, 3.5])
                 with col_profile_img:
-                    if img_url and str(img_url) != "nan" and str(img_url).strip() != "": st.image(img_url, width=130)
+                    if img_url and str(img_url) != "nan" and str(img_url).strip() != "": st.image(get_image_path(img_url) or img_url, width=130)
                     else: st.markdown("# 👤") 
                 with col_profile_info:
                     st.markdown(f"#### 📜 角色詳細資料\n* **職業：** {job_display}\n* **等級：** {display_level}\n* **資料來源：** 靜態資料庫 (非即時API回溯法)")
@@ -531,18 +818,16 @@ else:
             st.markdown("---")
 
             # 計算公會排名
-            guild_stats = df_period.groupby('暱稱').agg({'旗幟戰': 'sum', '地下水道': 'sum', '公會城每周': 'sum', '周次': 'nunique'})
-            guild_stats['flag_rank'] = guild_stats['旗幟戰'].rank(ascending=False, method='min')
-            guild_stats['water_rank'] = guild_stats['地下水道'].rank(ascending=False, method='min')
-            guild_stats['castle_rank'] = guild_stats['公會城每周'].rank(ascending=False, method='min')
+            # 與排行榜共用同一張快取的排名表，切換玩家不會重算全公會數據
+            with profiler.span("guild_stats"):
+                guild_stats = get_guild_ranking(week_cube, data_version, start_date, end_date)
+                rank_indexes = get_rank_indexes(week_cube, data_version, start_date, end_date)
 
             my_stats = guild_stats.loc[final_selected_player]
             p_flag = int(my_stats['旗幟戰']); p_water = int(my_stats['地下水道']); p_castle = int(my_stats['公會城每周']); my_weeks = int(my_stats['周次']) 
             rank_flag = int(my_stats['flag_rank']); rank_water = int(my_stats['water_rank']); rank_castle = int(my_stats['castle_rank'])
 
-            avg_flag = int(p_flag / my_weeks) if my_weeks > 0 else 0
-            avg_water = int(p_water / my_weeks) if my_weeks > 0 else 0
-            avg_castle_pct = int(float(p_castle / my_weeks)*10000)/100 if my_weeks > 0 else 0
+            avg_flag = int(my_stats['旗幟戰平均']); avg_water = int(my_stats['地下水道平均']); avg_castle_pct = float(my_stats['公會城出席率'])
 
             def get_rank_icon(rank):
                 if rank == 1: return "🥇 "
@@ -550,29 +835,9 @@ else:
                 elif rank == 3: return "🥉 "
                 else: return ""     
 
-            def get_detailed_neighbors(df_source, target_player, col_sum, col_weeks, mode='avg'):
-                df_sorted = df_source.sort_values(by=col_sum, ascending=False).reset_index()
-                try:
-                    my_score = df_sorted[df_sorted['暱稱'] == target_player][col_sum].values[0]
-                    my_idx = df_sorted[df_sorted['暱稱'] == target_player].index[0]
-                except IndexError: return None, None
-
-                def format_row(row, idx, is_neighbor=True):
-                    score = int(row[col_sum]); weeks = int(row[col_weeks]); neighbor_name = row['暱稱']
-                    real_rank = int(df_source.loc[neighbor_name][f"{'flag' if col_sum == '旗幟戰' else 'water' if col_sum == '地下水道' else 'castle'}_rank"])
-                    tie_text = " (同分)" if is_neighbor and score == my_score else ""
-                    if mode == 'avg':
-                        avg_val = int(score / weeks) if weeks > 0 else 0
-                        return f"第 {real_rank} 名{tie_text} : {score:,} (均 {avg_val:,})"
-                    else: 
-                        pct_val = int(float(score / weeks)*10000)/100 if weeks > 0 else 0.0
-                        return f"第 {real_rank} 名{tie_text} : {score} ({pct_val}%)"
-
-                if my_idx > 0: prev_str = f"⬆️ {format_row(df_sorted.iloc[my_idx - 1], my_idx)}" 
-                else: prev_str = "👑 目前第一"
-                if my_idx < len(df_sorted) - 1: next_str = f"⬇️ {format_row(df_sorted.iloc[my_idx + 1], my_idx + 2)}"
-                else: next_str = "🛡️ 目前墊底"
-                return prev_str, next_str
+            def get_detailed_neighbors(rank_index, target_player, mode='avg', k=NEIGHBOR_COUNT):
+                # 直接用預先排好的名次索引取前後 k 位，不必重新排序全公會
+                return guild_compute.neighbor_text(rank_index, target_player, mode=mode, k=k)
 
             st.markdown("### 🏆 本周戰績與排名情報")
             
@@ -615,116 +880,75 @@ else:
                 """
                 st.markdown(html_code, unsafe_allow_html=True)
 
-            col1, col2, col3, col4 = st.columns(4)
+            # 四張統計卡片 (含前後名次文字) 的 HTML 組裝與輸出
+            with profiler.span("stat_cards"):
+                col1, col2, col3, col4 = st.columns(4)
 
-            # 1. 統計週數
-            with col1:
-                left_card_style = "box-sizing: border-box; border-radius: 10px; padding: 15px; height: 100%; display: flex; flex-direction: column; justify-content: space-between; flex-grow: 1; border: 3px solid #444; background-color: #262730; box-shadow: 0 1px 3px rgba(0,0,0,0.12); color: white;"
+                # 1. 統計週數
+                with col1:
+                    left_card_style = "box-sizing: border-box; border-radius: 10px; padding: 15px; height: 100%; display: flex; flex-direction: column; justify-content: space-between; flex-grow: 1; border: 3px solid #444; background-color: #262730; box-shadow: 0 1px 3px rgba(0,0,0,0.12); color: white;"
                 
-                html_left = f"""
-                <div style="{left_card_style}">
-                    <div>
-                        <div style="font-weight: bold; font-size: 1.5rem; margin-bottom: 5px;">📊 統計週數</div>
-                        <div style="font-size: 2.5rem; font-weight: bold; color: #FF9F1C; line-height: 1.2;">{my_weeks} 週</div>
-                        <div style="font-size: 1.5rem; margin-bottom: 5px;">📅 區間累計</div>
+                    html_left = f"""
+                    <div style="{left_card_style}">
+                        <div>
+                            <div style="font-weight: bold; font-size: 1.5rem; margin-bottom: 5px;">📊 統計週數</div>
+                            <div style="font-size: 2.5rem; font-weight: bold; color: #FF9F1C; line-height: 1.2;">{my_weeks} 週</div>
+                            <div style="font-size: 1.5rem; margin-bottom: 5px;">📅 區間累計</div>
+                        </div>
+                        <div>
+                            <hr style="margin: 10px 0; border-color: #555;">
+                            <div style="font-size: 0.9rem; color: #CCC; margin-bottom: 3px;">📅 開始：{start_date}</div>
+                            <div style="font-size: 0.9rem; color: #CCC;">📅 結束：{end_date}</div>
+                        </div>
                     </div>
-                    <div>
-                        <hr style="margin: 10px 0; border-color: #555;">
-                        <div style="font-size: 0.9rem; color: #CCC; margin-bottom: 3px;">📅 開始：{start_date}</div>
-                        <div style="font-size: 0.9rem; color: #CCC;">📅 結束：{end_date}</div>
-                    </div>
-                </div>
-                """
-                st.markdown(html_left, unsafe_allow_html=True)
-
-            # 2. 旗幟戰
-            with col2:
-                prev_txt, next_txt = get_detailed_neighbors(guild_stats, final_selected_player, '旗幟戰', '周次', mode='avg')
-                rank_str = f"{get_rank_icon(rank_flag)}第 {rank_flag} 名 <span style='font-size:1.0rem; color:#BBB'>(均 {avg_flag:,})</span>"
-                draw_stat_card("🚩 旗幟戰", f"{p_flag:,} 分", rank_str, prev_txt, next_txt, rank=rank_flag)
-
-            # 3. 地下水道
-            with col3:
-                prev_txt, next_txt = get_detailed_neighbors(guild_stats, final_selected_player, '地下水道', '周次', mode='avg')
-                rank_str = f"{get_rank_icon(rank_water)}第 {rank_water} 名 <span style='font-size:1.0rem; color:#BBB'>(均 {avg_water:,})</span>"
-                draw_stat_card("💧 地下水道", f"{p_water:,} 分", rank_str, prev_txt, next_txt, rank=rank_water)
-
-            # 4. 公會城
-            with col4:
-                castle_title = "👑 公會城 (全勤)" if avg_castle_pct == 100 else "🏰 公會城"
-                prev_txt, next_txt = get_detailed_neighbors(guild_stats, final_selected_player, '公會城每周', '周次', mode='pct')
+                    """
+                    st.markdown(html_left, unsafe_allow_html=True)
+
+                # 2. 旗幟戰
+                with col2:
+                    prev_txt, next_txt = get_detailed_neighbors(rank_indexes['旗幟戰'], final_selected_player, mode='avg')
+                    rank_str = f"{get_rank_icon(rank_flag)}第 {rank_flag} 名 <span style='font-size:1.0rem; color:#BBB'>(均 {avg_flag:,})</span>"
+                    draw_stat_card("🚩 旗幟戰", f"{p_flag:,} 分", rank_str, prev_txt, next_txt, rank=rank_flag)
+
+                # 3. 地下水道
+                with col3:
+                    prev_txt, next_txt = get_detailed_neighbors(rank_indexes['地下水道'], final_selected_player, mode='avg')
+                    rank_str = f"{get_rank_icon(rank_water)}第 {rank_water} 名 <span style='font-size:1.0rem; color:#BBB'>(均 {avg_water:,})</span>"
+                    draw_stat_card("💧 地下水道", f"{p_water:,} 分", rank_str, prev_txt, next_txt, rank=rank_water)
+
+                # 4. 公會城
+                with col4:
+                    castle_title = "👑 公會城 (全勤)" if avg_castle_pct == 100 else "🏰 公會城"
+                    prev_txt, next_txt = get_detailed_neighbors(rank_indexes['公會城每周'], final_selected_player, mode='pct')
                 
-                if avg_castle_pct == 100:
-                    # --- 這裡修正了：使用 class='rainbow-text' 替代 :rainbow[] ---
-                    rank_str = f"👑 <span class='rainbow-text'>完美全勤!!</span> <span style='font-size:1.0rem; color:#BBB'>({avg_castle_pct}%)</span>"
-                    display_rank = 1 # 全勤強制金牌特效
-                else:
-                    rank_str = f"{get_rank_icon(rank_castle)}第 {rank_castle} 名 <span style='font-size:1.0rem; color:#BBB'>({avg_castle_pct}%)</span>"
-                    display_rank = rank_castle
+                    if avg_castle_pct == 100:
+                        # --- 這裡修正了：使用 class='rainbow-text' 替代 :rainbow[] ---
+                        rank_str = f"👑 <span class='rainbow-text'>完美全勤!!</span> <span style='font-size:1.0rem; color:#BBB'>({avg_castle_pct}%)</span>"
+                        display_rank = 1 # 全勤強制金牌特效
+                    else:
+                        rank_str = f"{get_rank_icon(rank_castle)}第 {rank_castle} 名 <span style='font-size:1.0rem; color:#BBB'>({avg_castle_pct}%)</span>"
+                        display_rank = rank_castle
 
-                draw_stat_card(castle_title, f"{p_castle} 次", rank_str, prev_txt, next_txt, rank=display_rank)
+                    draw_stat_card(castle_title, f"{p_castle} 次", rank_str, prev_txt, next_txt, rank=display_rank)
 
             # --- 修改重點：新增了第四個 Tab 內容 ---
-            tab1, tab2, tab3, tab4 = st.tabs(["📈 個人走勢圖", "📋 詳細記錄", "🍩 達成狀況", "⚖️ 升降階紀錄"])
+            # 只渲染目前選中的分頁：圖表、表格只在被看到時才計算與傳送
+            personal_tabs = ["📈 個人走勢圖", "📋 詳細記錄", "🍩 達成狀況", "⚖️ 升降階紀錄"]
+            selected_tab = st.radio("報告分頁", personal_tabs, horizontal=True, label_visibility="collapsed", key="personal_tab")
 
-            with tab1:
+            if selected_tab == personal_tabs[0]:
                 chart_type = st.radio("選擇數據類型", ["旗幟戰", "地下水道", "公會城每周"], horizontal=True)
                 if chart_type == "旗幟戰": line_color = "#FF6B6B"; y_label = "分數"
                 elif chart_type == "地下水道": line_color = "#4D96FF"; y_label = "分數"
                 else: line_color = "#6BCB77"; y_label = "完成狀態 (1=有, 0=無)"
 
-                fig_line = px.line(df_filtered, x='周次', y=chart_type, title=f"{final_selected_player} - {chart_type} 趨勢", markers=True)
-                fig_line.update_traces(line_color=line_color, line_width=3, marker_size=6, marker_color=line_color, name="實際分數")
-
-                if chart_type == "地下水道" and len(df_filtered) > 1:
-                    try:
-                        # --- 修改開始 ---
-                        # 1. 將日期轉換為「距離第一天的天數」，這樣算出來的斜率單位就是「分/天」
-                        base_date = df_filtered['周次'].min()
-                        x_days = (df_filtered['周次'] - base_date).dt.days
-                        y_scores = df_filtered[chart_type]
-                        
-                        # 2. 計算線性回歸 (1代表一次方程式 y = ax + b)
-                        slope_daily, intercept = np.polyfit(x_days, y_scores, 1)
-                        
-                        # 3. 將「每天進步」轉換為「每週進步」(乘以 7)
-                        slope_weekly = slope_daily * 7
-                        
-                        # 4. 計算趨勢線的 Y 軸數值
-                        y_trend = slope_daily * x_days + intercept
-                        
-                        # 5. 設定顯示文字 (加上正負號與千分位逗號)
-                        trend_label = f'📈 趨勢 (週成長: {int(slope_weekly):+,})'
-                        
-                        fig_line.add_scatter(
-                            x=df_filtered['周次'], 
-                            y=y_trend, 
-                            mode='lines', 
-                            name=trend_label, # 這裡會顯示計算出來的斜率
-                            line=dict(color='red', width=2, dash='dash'), 
-                            hoverinfo='name+y'
-                        )
-                        # --- 修改結束 ---
-                    except Exception as e:
-                        pass
-
-                avg_score = df_filtered[chart_type].mean()
-                if chart_type != "公會城每周" and avg_score > 0:
-                    fig_line.add_hline(y=avg_score, line_dash="dot", line_color="gray", annotation_text=f"平均: {int(avg_score):,}", annotation_position="bottom right")
-
-                fig_line.update_layout(
-                    xaxis=dict(tickformat="%Y-%m-%d", fixedrange=True),
-                    yaxis=dict(title=y_label, fixedrange=True),
-                    hovermode="x unified",
-                    showlegend=True,
-                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                    dragmode=False 
-                )
-                
-                st.plotly_chart(fig_line, use_container_width=True, config=PLOT_CONFIG, height=600)
+                # 圖表依 (玩家, 數據類型, 日期區間, 資料版本) 快取，切換分頁或其他元件時不用重畫
+                with profiler.span("figure_trend"):
+                    fig_line = build_trend_figure(df_filtered, final_selected_player, chart_type, line_color, y_label, start_date, end_date, data_version)
+                    st.plotly_chart(fig_line, use_container_width=True, config=PLOT_CONFIG, height=600)
                 if chart_type == "公會城每周": st.caption("ℹ️ 1 代表有完成，0 代表未完成")
 
-            with tab2:
+            elif selected_tab == personal_tabs[1]:
                 #先排序再顯示 (由新到舊)
                 df_detail_view = df_filtered.sort_values('周次', ascending=False)
                 
@@ -739,7 +963,7 @@ else:
                     }
                 )
 
-            with tab3:
+            elif selected_tab == personal_tabs[2]:
                 st.markdown("### 📊 達成率分析對比")
                 col1, col2 = st.columns(2) # 切分成兩欄
                 
@@ -747,6 +971,7 @@ else:
                 with col1:
                     if '本周是否達成' in df_filtered.columns:
                         cnt1 = df_filtered['本周是否達成'].value_counts().reset_index()
+                        cnt1 = cnt1[cnt1.iloc[:, 1] > 0] # category 欄位會列出 0 筆的狀態，先排除
                         cnt1.columns = ['狀態', '數量']
                         if not cnt1.empty:
                             fig1 = px.pie(cnt1, values='數量', names='狀態', title='周達成率(單周/不會降階)', 
@@ -784,56 +1009,23 @@ else:
                             st.plotly_chart(fig_pie_change, use_container_width=True, config=PLOT_CONFIG, height=600)
 
             # --- 新增的第四個 Tab 內容 ---
-            with tab4:
+            elif selected_tab == personal_tabs[3]:
                 st.markdown("### ⚖️ 職位異動歷史")
                 if '異動與否' in df_filtered.columns:
-                    # 篩選出有「升階」或「降階」的紀錄
-                    change_log = df_filtered[df_filtered['異動與否'].isin(['升階', '降階'])].copy()
+                    # 從整批算好的全公會升降階紀錄直接切出這位玩家 (已含備註、由新到舊)
+                    with profiler.span("change_log"):
+                        change_log = get_change_log(df, data_version).for_player(final_selected_player, start_date, end_date)
                     
                     if not change_log.empty:
-                        # 1. 新增排序邏輯：由新到舊
-                        change_log = change_log.sort_values('周次', ascending=False)
-
-                        # --- 核心修改：建立「備註」欄位 ---
-                        def generate_note(row):
-                            notes = []
-                            # 1. 地下水道
-                            if row['地下水道'] > 0:
-                                notes.append(f"地下水道{int(row['地下水道'])}分")
-                            # 2. 旗幟戰
-                            if row['旗幟戰'] > 0:
-                                notes.append(f"旗幟{int(row['旗幟戰'])}分")
-                            # 3. 公會城
-                            if row['公會城每周'] > 0: # 假設 1 代表有打
-                                notes.append("公會城每周達成")
-                            
-                            if not notes:
-                                return "近兩周未有記錄"
-                            return " / ".join(notes)
-                        
-                        change_log['備註'] = change_log.apply(generate_note, axis=1)
-                        change_log['周次'] = change_log['周次'].dt.date
-                        
                         # 整理要顯示的欄位: 日期 / 變動類型 / 備註
-                        display_df = change_log[['周次', '異動與否', '備註']]
-                        display_df.columns = ['日期', '變動類型', '備註']
+                        display_df = pd.DataFrame({
+                            '日期': change_log['周次'].dt.date,
+                            '變動類型': change_log['異動與否'],
+                            '備註': change_log['備註'],
+                        })
 
-                        # === 核心修改：整行變色邏輯 ===
-                        def highlight_rows(row):
-                            # 預設樣式 (無)
-                            styles = [''] * len(row)
-                            
-                            if row['變動類型'] == '升階':
-                                # 整行綠色背景 + 綠色文字 + 粗體
-                                return ['background-color: #006000; color: #00EC00; font-weight: bold;'] * len(row)
-                            elif row['變動類型'] == '降階':
-                                # 整行紅色背景 + 紅色文字 + 粗體
-                                return ['background-color: #800000; color: #F08080; font-weight: bold;'] * len(row)
-                            
-                            return styles
-
-                        # 使用 Pandas Styler apply (axis=1 代表逐列掃描)
-                        styled_df = display_df.style.apply(highlight_rows, axis=1)
+                        # === 整行變色：升階綠色、降階紅色 (一次算完整張表，不逐列呼叫) ===
+                        styled_df = display_df.style.apply(guild_compute.change_row_styles, axis=None)
 
                         # 2. 新增 height 參數 (800px)
                         st.dataframe(
@@ -852,7 +1044,20 @@ else:
                 else:
                     st.warning("資料中找不到 '異動與否' 欄位。")
 
-
-
-
-
+# ==========================================
+# 效能分析面板 (僅管理員)
+# ==========================================
+profile_record = profiler.finish(mode=search_mode)
+if ADMIN_KEY and st.query_params.get("admin") == ADMIN_KEY:
+    with st.sidebar.expander("⏱️ 效能分析 (本次執行)", expanded=False):
+        st.metric("總耗時", f"{profile_record['total_ms']:,.0f} ms")
+        st.dataframe(
+            pd.DataFrame(profiler.rows()),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "毫秒": st.column_config.NumberColumn(format="%.1f"),
+                "佔比": st.column_config.ProgressColumn(format="%.0f%%", min_value=0, max_value=100),
+            }
+        )
+        st.caption(f"紀錄檔：{perf_trace.PROFILE_LOG_DIR}/{profiler.session_id}.jsonl")
@@ -0,0 +1,289 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import guild_store
+import guild_compute
+
+# ================= 設定區 =================
+BASELINE_FILE = "benchmark_baseline.json"   # 基準時間 (python benchmark.py --save-baseline 產生)
+REGRESSION_TOLERANCE = 0.25                 # 比基準慢超過 25% 就算退步
+REPEAT = 5                                  # 每個項目跑幾次取最快的一次
+DEFAULT_PLAYERS = 500
+DEFAULT_WEEKS = 156                         # 3 年
+# 擴展曲線：(玩家數, 周數)，最大到 1 萬人 × 5 年
+SCALING_SIZES = [(100, 52), (500, 156), (1000, 260), (2500, 260), (5000, 260), (10000, 260)]
+# =========================================
+
+# 合成資料用的職業 (前幾個職業人比較多，接近真實公會的分布)
+SYNTHETIC_JOBS = [
+    "阿戴爾", "黑騎士", "菈菈", "暗夜行者", "陰陽師", "破風使者", "琳恩", "傑諾", "炭治郎",
+    "大魔導士(火、毒)", "大魔導士(冰、雷)", "主教", "箭神", "神射手", "夜使者", "影武者",
+    "拳霸", "槍神", "英雄", "聖騎士", "開拓者", "暗影神偷", "重砲指揮官", "凱撒", "天使破壞者",
+]
+
+
+def make_synthetic_guild_data(n_players, n_weeks, seed=0):
+    """產生和 guild_data.csv 同欄位的合成資料 (n_players 位成員 × n_weeks 周)
+
+    - 成員有加入 / 離開公會的時間，不是每週都在
+    - 旗幟戰 100~1000 (100 的倍數)、地下水道長尾分布、公會城 0/1，各自有參加率
+    - 本周是否達成、近兩周是否達成依分數推算；升階 / 降階約各 1.5%
+    - 和真實資料一樣，每位成員第一周的 近兩周是否達成 / 異動與否 是空白 (NaN)
+    """
+    rng = np.random.default_rng(seed)
+    first_week = pd.Timestamp("2021-01-04")
+    week_dates = pd.date_range(first_week, periods=n_weeks, freq="7D")
+
+    # 每位成員的在籍區間
+    join = rng.integers(0, max(1, n_weeks // 2), n_players)
+    join[: n_players // 3] = 0
+    stay = rng.integers(max(1, n_weeks // 4), n_weeks + 1, n_players)
+    leave = np.minimum(join + stay, n_weeks)
+
+    player_idx = np.repeat(np.arange(n_players), leave - join)
+    week_idx = np.concatenate([np.arange(s, e) for s, e in zip(join, leave)]) if n_players else np.array([], dtype=int)
+    n = len(player_idx)
+
+    # 每位成員的活躍程度決定各活動的參加率
+    activity = rng.beta(2, 2, n_players)[player_idx]
+    flag = np.where(rng.random(n) < activity * 0.6, rng.integers(1, 11, n) * 100, 0)
+    water = np.where(rng.random(n) < activity * 0.8, rng.lognormal(9.5, 1.2, n).astype('int64') + 1, 0)
+    castle = (rng.random(n) < activity * 0.7).astype('int64')
+
+    achieved = (flag >= 500) | (water >= 10000) | (castle > 0)
+    prev_achieved = np.r_[False, achieved[:-1]] & np.r_[False, player_idx[1:] == player_idx[:-1]]
+    change_roll = rng.random(n)
+    change = np.where(change_roll < 0.015, "升階", np.where(change_roll < 0.03, "降階", "否")).astype(object)
+    two_weeks = np.where(achieved | prev_achieved, "達成", "未達成").astype(object)
+    first_week = np.r_[True, player_idx[1:] != player_idx[:-1]] if n else np.array([], dtype=bool)
+    change[first_week] = np.nan
+    two_weeks[first_week] = np.nan
+
+    job_weights = 1.0 / np.arange(1, len(SYNTHETIC_JOBS) + 1)
+    jobs = rng.choice(SYNTHETIC_JOBS, n_players, p=job_weights / job_weights.sum())
+    names = np.array([f"成員{i:05d}" for i in range(n_players)])
+    levels = rng.integers(200, 290, n_players)
+
+    df = pd.DataFrame({
+        '周次': week_dates[week_idx].strftime("%Y-%m-%d"),
+        '暱稱': names[player_idx],
+        '旗幟戰': flag,
+        '地下水道': water,
+        '公會城每周': castle,
+        '本周是否達成': np.where(achieved, "達成", "未達成"),
+        '近兩周是否達成': two_weeks,
+        '異動與否': change,
+        '等級': levels[player_idx],
+        '職業': jobs[player_idx],
+        '圖片': "https://open.api.nexon.com/static/maplestorytw/character/look/" + names[player_idx],
+    })
+    # 和 update_tool 產生的檔案一樣依周次排列
+    return df.sort_values('周次', kind='stable').reset_index(drop=True)
+
+
+def _best_time(fn, repeat=REPEAT):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def check_search(df, names):
+    """原始資料查詢的正確性檢查：抽樣玩家的每一列都要搜得到，包含有空白欄位的列
+
+    另外把一部分列的 近兩周是否達成 / 異動與否 清成空值 (真實資料每位成員第一周就是空的)，
+    空值不能讓整列的搜尋文字消失。
+    """
+    df = df.copy()
+    for col in ['近兩周是否達成', '異動與否']:
+        if col in df.columns:
+            df[col] = df[col].astype(object)
+            df.loc[df.index[::5], col] = np.nan
+    index = guild_compute.SearchIndex(df)
+    player_col = df['暱稱'].astype(str)
+    for name in names:
+        own_rows = player_col == str(name)
+        found = index.search(name)
+        if not found[own_rows].all():
+            raise AssertionError(f"原始資料查詢漏掉 {name} 的 {int((~found[own_rows]).sum())} 筆資料")
+
+
+def check_reports(df, lookups, ranking, names):
+    """靜態匯出的正確性檢查：個人報告要能寫成合法的 JSON (空白欄位不能變成 NaN)"""
+    indexes = guild_compute.build_rank_indexes(ranking)
+    change_log = guild_compute.ChangeLog(df)
+    for name in names:
+        report = guild_compute.player_report(name, df, lookups, ranking, indexes, change_log)
+        if report is not None:
+            json.dumps(report, ensure_ascii=False, allow_nan=False)
+
+
+def run_benchmarks(n_players, n_weeks, repeat=REPEAT, seed=0):
+    """對網站的主要計算路徑計時 (不需要 Streamlit)，回傳 {項目: 秒數}"""
+    raw = make_synthetic_guild_data(n_players, n_weeks, seed)
+    csv_bytes = raw.to_csv(index=False).encode('utf-8')
+    rng = np.random.default_rng(seed + 1)
+    timings = {}
+
+    # 1. load_data：解析 CSV + 整理型別 + 建立時間索引 / 前綴和矩陣 / 查詢索引
+    def load():
+        df = guild_compute.sort_by_week(guild_store.normalize_guild_df(pd.read_csv(io.BytesIO(csv_bytes))))
+        return df, guild_compute.TimeIndex(df), guild_compute.WeekCube(df), guild_compute.LookupIndex(df)
+
+    timings['load_data'], (df, time_index, cube, lookups) = _best_time(load, repeat)
+
+    weeks = time_index.weeks
+    recent_start = weeks[max(0, len(weeks) - 12)]
+    ranges = [(weeks[0], weeks[-1]), (recent_start, weeks[-1])]
+
+    # 2. 排行榜：全公會區間排名 (全部歷史 + 最近 12 周)
+    timings['leaderboard'], ranking = _best_time(
+        lambda: [guild_compute.guild_ranking(cube, s, e) for s, e in ranges][0], repeat)
+
+    # 3. 個人頁：排名索引 + 前後名次 (抽 100 位玩家)
+    sample = rng.choice(lookups.all_players, min(100, len(lookups.all_players)), replace=False)
+
+    def neighbors():
+        indexes = guild_compute.build_rank_indexes(ranking)
+        return [indexes[col].neighbors(name, k=1) for name in sample for col in indexes]
+
+    timings['neighbors'], _ = _best_time(neighbors, repeat)
+
+    # 4. 個人頁：取出單一玩家的區間資料列
+    timings['player_rows'], _ = _best_time(
+        lambda: [df.iloc[lookups.player_rows(name, recent_start, weeks[-1])] for name in sample], repeat)
+
+    # 5. 原始資料查詢：建索引 + 幾種常見的關鍵字
+    queries = ["阿戴爾", "成員0001", "升階", "陰陽*", str(weeks[-1])]
+
+    def search():
+        index = guild_compute.SearchIndex(df)
+        rows = time_index.slice(df, recent_start, weeks[-1]).index
+        return [index.search(q, rows).sum() for q in queries]
+
+    timings['search'], _ = _best_time(search, repeat)
+    check_search(df, sample)
+    check_reports(df, lookups, ranking, sample[:20])
+
+    # 6. 升降階紀錄：整批建表 + 個人紀錄 + 單周名單
+    def change_log():
+        log = guild_compute.ChangeLog(df)
+        for name in sample[:20]:
+            log.for_player(name, weeks[0], weeks[-1])
+        latest = log.latest_week(weeks[0], weeks[-1])
+        return log.week_report(latest) if latest is not None else None
+
+    timings['change_log'], _ = _best_time(change_log, repeat)
+
+    return timings, len(df)
+
+
+def _size_key(n_players, n_weeks):
+    return f"{n_players}x{n_weeks}"
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(baseline, path=BASELINE_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def compare_with_baseline(timings, baseline_timings, tolerance=REGRESSION_TOLERANCE):
+    """回傳退步的項目 [(項目, 基準秒數, 這次秒數)]"""
+    regressions = []
+    for name, seconds in timings.items():
+        base = baseline_timings.get(name)
+        if base and seconds > base * (1 + tolerance):
+            regressions.append((name, base, seconds))
+    return regressions
+
+
+def print_timings(timings, baseline_timings=None):
+    for name, seconds in timings.items():
+        line = f"   {name:<12} {seconds * 1000:10.2f} ms"
+        base = (baseline_timings or {}).get(name)
+        if base:
+            line += f"   (基準 {base * 1000:.2f} ms, {seconds / base - 1:+.0%})"
+        print(line)
+
+
+def run_scaling(repeat, output=None):
+    """依 SCALING_SIZES 逐一計時，印出擴展曲線 (可另存 CSV)"""
+    rows = []
+    for n_players, n_weeks in SCALING_SIZES:
+        print(f"⏳ {n_players} 人 × {n_weeks} 周 ...")
+        timings, n_rows = run_benchmarks(n_players, n_weeks, repeat)
+        rows.append({'玩家數': n_players, '周數': n_weeks, '資料列': n_rows,
+                     **{name: round(seconds * 1000, 2) for name, seconds in timings.items()}})
+
+    curve = pd.DataFrame(rows)
+    print("\n📈 擴展曲線 (毫秒)：")
+    print(curve.to_string(index=False))
+    if output:
+        curve.to_csv(output, index=False, encoding='utf-8-sig')
+        print(f"💾 已儲存 {output}")
+    return curve
+
+
+def main():
+    parser = argparse.ArgumentParser(description="公會網站計算路徑效能測試 (合成資料)")
+    parser.add_argument("--players", type=int, default=DEFAULT_PLAYERS, help="合成資料的成員數")
+    parser.add_argument("--weeks", type=int, default=DEFAULT_WEEKS, help="合成資料的周數")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="每個項目重複次數 (取最快)")
+    parser.add_argument("--save-baseline", action="store_true", help="把這次的結果存成基準")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基準檔案路徑")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="容許的變慢比例")
+    parser.add_argument("--scaling", action="store_true", help="跑擴展曲線 (最大 1 萬人 × 5 年)")
+    parser.add_argument("--scaling-output", default=None, help="擴展曲線另存 CSV")
+    args = parser.parse_args()
+
+    if args.scaling:
+        run_scaling(args.repeat, args.scaling_output)
+        return 0
+
+    key = _size_key(args.players, args.weeks)
+    print(f"⏳ 產生合成資料並計時：{args.players} 人 × {args.weeks} 周 (每項 {args.repeat} 次取最快)")
+    timings, n_rows = run_benchmarks(args.players, args.weeks, args.repeat)
+    print(f"📊 共 {n_rows} 筆資料")
+
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        baseline[key] = timings
+        save_baseline(baseline, args.baseline)
+        print_timings(timings)
+        print(f"💾 已儲存基準到 {args.baseline}")
+        return 0
+
+    base_timings = baseline.get(key)
+    print_timings(timings, base_timings)
+    if not base_timings:
+        print(f"ℹ️ 沒有 {key} 的基準資料，加上 --save-baseline 建立")
+        return 0
+
+    regressions = compare_with_baseline(timings, base_timings, args.tolerance)
+    if regressions:
+        print(f"❌ 有 {len(regressions)} 個項目比基準慢超過 {args.tolerance:.0%}：")
+        for name, base, seconds in regressions:
+            print(f"   {name}: {base * 1000:.2f} ms -> {seconds * 1000:.2f} ms")
+        return 1
+
+    print("✅ 沒有效能退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import os
+import re
+import sys
+import json
+import html
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import guild_store
+import guild_compute
+
+# ================= 設定區 =================
+OUTPUT_DIR = "reports"                  # 靜態報告輸出資料夾
+MAX_WORKERS = os.cpu_count() or 2       # 同時幾個行程產生個人報告
+CHUNK_SIZE = 50                         # 每個工作批次處理幾位成員
+NEIGHBOR_COUNT = 1                      # 個人報告顯示前後各幾位
+# =========================================
+
+LEADERBOARDS = [
+    ('旗幟戰', '🚩 旗幟戰排行'),
+    ('地下水道', '💧 地下水道排行'),
+    ('公會城每周', '🏰 公會城全勤榜'),
+]
+
+PAGE_STYLE = """
+body { font-family: sans-serif; background: #0e1117; color: #fafafa; margin: 2rem; }
+a { color: #4D96FF; }
+table { border-collapse: collapse; margin: 1rem 0; }
+th, td { border: 1px solid #444; padding: 4px 10px; text-align: left; }
+th { background: #262730; }
+.card { display: inline-block; vertical-align: top; background: #262730; border-radius: 10px; padding: 12px 18px; margin: 6px; min-width: 220px; }
+.neighbor { color: #BBB; font-size: 0.9rem; white-space: pre-line; }
+"""
+
+# 每個工作行程各自載入一次的資料 (在 _init_worker 建立)
+_state = None
+
+
+def load_state(csv_path, columnar_path, start_date=None, end_date=None, last_weeks=None):
+    """讀資料並建好報告需要的全部索引 (和網站的 load_data 相同)"""
+    df = guild_compute.sort_by_week(guild_store.read_guild_data(csv_path, columnar_path))
+    time_index = guild_compute.TimeIndex(df)
+    if end_date is None:
+        end_date = time_index.weeks[-1]
+    if last_weeks:
+        weeks = [w for w in time_index.weeks if w <= end_date]
+        start_date = weeks[max(0, len(weeks) - last_weeks)]
+    elif start_date is None:
+        start_date = time_index.weeks[0]
+    cube = guild_compute.WeekCube(df)
+    ranking = guild_compute.guild_ranking(cube, start_date, end_date)
+    return {
+        'df': df,
+        'time_index': time_index,
+        'lookups': guild_compute.LookupIndex(df),
+        'ranking': ranking,
+        'rank_indexes': guild_compute.build_rank_indexes(ranking),
+        'change_log': guild_compute.ChangeLog(df),
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+
+
+def safe_filename(name):
+    """暱稱 -> 檔名 (去掉檔案系統不允許的字元)
+
+    後面一律加上暱稱的短雜湊：去掉字元後變成同一個名字的暱稱 (例如 a/b 和 a:b)，
+    或只差大小寫的暱稱 (Windows / macOS 不分大小寫) 才不會互相覆蓋。
+    """
+    cleaned = re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('._') or "_"
+    digest = hashlib.sha1(str(name).encode('utf-8')).hexdigest()[:8]
+    return f"{cleaned}_{digest}"
+
+
+def _page(title, body):
+    return (f"<!DOCTYPE html>\n<html lang=\"zh-Hant\"><head><meta charset=\"utf-8\">"
+            f"<title>{html.escape(title)}</title><style>{PAGE_STYLE}</style></head>\n"
+            f"<body>\n{body}\n</body></html>\n")
+
+
+def _table(df):
+    return df.to_html(index=False, escape=True, border=0)
+
+
+def render_player_html(report, start_date, end_date):
+    name = html.escape(report['暱稱'])
+    level = report['等級'] if report['等級'] is not None else "???"
+    parts = [
+        '<p><a href="../index.html">← 回到總覽</a></p>',
+        f"<h1>👤 {name} 的個人數據報告</h1>",
+        f"<p>📅 {start_date} ~ {end_date}　|　職業：{html.escape(report['職業'])}　|　等級：{level}　|　統計週數：{report['統計週數']} 週</p>",
+    ]
+    for col, info in report['活動'].items():
+        if col == '公會城每周':
+            summary = f"{info['總計']} 次 ({report['公會城出席率']}%)"
+        else:
+            summary = f"{info['總計']:,} 分 (均 {report[col + '平均']:,})"
+        parts.append(
+            f"<div class=\"card\"><h3>{html.escape(col)}</h3><div>{summary}</div>"
+            f"<div>第 {info['名次']} 名</div>"
+            f"<div class=\"neighbor\">{html.escape(info['前面'] or '')}\n{html.escape(info['後面'] or '')}</div></div>"
+        )
+    parts.append("<h2>📋 詳細記錄</h2>")
+    parts.append(_table(pd.DataFrame(report['每周紀錄'])))
+    parts.append("<h2>⚖️ 升降階紀錄</h2>")
+    if report['升降階紀錄']:
+        parts.append(_table(pd.DataFrame(report['升降階紀錄'])))
+    else:
+        parts.append("<p>此玩家目前沒有「升階」或「降階」的紀錄。</p>")
+    return _page(f"{report['暱稱']} 個人報告", "\n".join(parts))
+
+
+def _init_worker(csv_path, columnar_path, start_date, end_date):
+    global _state
+    _state = load_state(csv_path, columnar_path, start_date, end_date)
+
+
+def export_players(names, output_dir):
+    """產生一批成員的個人報告 (JSON + HTML)，回傳成功筆數"""
+    state = _state
+    player_dir = os.path.join(output_dir, "players")
+    os.makedirs(player_dir, exist_ok=True)
+    count = 0
+    for name in names:
+        report = guild_compute.player_report(
+            name, state['df'], state['lookups'], state['ranking'], state['rank_indexes'],
+            state['change_log'], state['start_date'], state['end_date'], k=NEIGHBOR_COUNT,
+        )
+        if report is None:
+            continue
+        base = os.path.join(player_dir, safe_filename(name))
+        with open(base + ".json", 'w', encoding='utf-8') as f:
+            # allow_nan=False：萬一又有 NaN 混進來就直接報錯，不要寫出瀏覽器讀不了的 JSON
+            json.dump(report, f, ensure_ascii=False, indent=1, allow_nan=False)
+        with open(base + ".html", 'w', encoding='utf-8') as f:
+            f.write(render_player_html(report, state['start_date'], state['end_date']))
+        count += 1
+    return count
+
+
+def export_leaderboards(state, output_dir):
+    """三個排行榜與總覽頁 (JSON + HTML)"""
+    os.makedirs(output_dir, exist_ok=True)
+    start_date, end_date = state['start_date'], state['end_date']
+    boards = {}
+    sections = [f"<h1>📊 公會排行榜 ({start_date} ~ {end_date})</h1>"]
+    for col, title in LEADERBOARDS:
+        board = guild_compute.leaderboard_table(state['ranking'], col)[['名次', '暱稱', '職業', '周次', col]]
+        board = board.rename(columns={'周次': '統計週數'})
+        board['職業'] = board['職業'].astype(str)
+        boards[col] = json.loads(board.to_json(orient='records', force_ascii=False))
+
+        linked = board.copy()
+        linked['暱稱'] = [f'<a href="players/{html.escape(safe_filename(n))}.html">{html.escape(str(n))}</a>' for n in board['暱稱']]
+        linked['職業'] = board['職業'].map(html.escape)
+        sections.append(f"<h2>{title}</h2>")
+        sections.append(linked.to_html(index=False, escape=False, border=0))
+
+    with open(os.path.join(output_dir, "leaderboard.json"), 'w', encoding='utf-8') as f:
+        json.dump({'start_date': str(start_date), 'end_date': str(end_date), 'leaderboards': boards},
+                  f, ensure_ascii=False, indent=1, allow_nan=False)
+    with open(os.path.join(output_dir, "index.html"), 'w', encoding='utf-8') as f:
+        f.write(_page("公會每周統計", "\n".join(sections)))
+
+
+def _parse_date(value):
+    return pd.Timestamp(value).date() if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把每位成員的個人報告與排行榜輸出成靜態 HTML / JSON")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="輸出資料夾")
+    period = parser.add_mutually_exclusive_group()
+    period.add_argument("--start", default=None, help="開始日期 (預設資料的第一周)")
+    period.add_argument("--last-weeks", type=int, default=None, help="只統計最後 N 周 (與 --start 擇一)")
+    parser.add_argument("--end", default=None, help="結束日期 (預設資料的最後一周)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="同時幾個行程")
+    parser.add_argument("--csv", default=guild_store.CSV_FILE)
+    parser.add_argument("--columnar", default=guild_store.COLUMNAR_FILE)
+    args = parser.parse_args()
+
+    t0 = time.time()
+    print("⏳ 讀取資料...")
+    start_date, end_date = _parse_date(args.start), _parse_date(args.end)
+    state = load_state(args.csv, args.columnar, start_date, end_date, args.last_weeks)
+    start_date, end_date = state['start_date'], state['end_date']
+    print(f"📅 統計區間：{start_date} ~ {end_date}")
+
+    export_leaderboards(state, args.output)
+    print(f"🏆 排行榜已輸出到 {args.output}/index.html")
+
+    names = list(state['ranking'].index.astype(str))
+    chunks = [names[i:i + CHUNK_SIZE] for i in range(0, len(names), CHUNK_SIZE)]
+    print(f"👥 產生 {len(names)} 位成員的個人報告 ({args.workers} 個行程)...")
+
+    done = 0
+    if args.workers <= 1:
+        global _state
+        _state = state
+        for chunk in chunks:
+            done += export_players(chunk, args.output)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.csv, args.columnar, start_date, end_date)) as executor:
+            futures = [executor.submit(export_players, chunk, args.output) for chunk in chunks]
+            for i, future in enumerate(as_completed(futures), 1):
+                done += future.result()
+                print(f"   ({i}/{len(chunks)}) 已完成 {done} 位")
+
+    print(f"✅ 完成！共 {done} 份個人報告，耗時 {time.time() - t0:.1f} 秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
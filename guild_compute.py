@@ -0,0 +1,486 @@
+import numpy as np
+import pandas as pd
+
+# 每周累加的活動欄位
+ACTIVITY_COLS = ['旗幟戰', '地下水道', '公會城每周']
+
+
+def _to_day_start(value):
+    """date / datetime / 字串 -> 當天 00:00 的 numpy datetime64"""
+    return np.datetime64(pd.Timestamp(value).normalize().to_datetime64())
+
+
+def period_bounds(sorted_weeks, start_date=None, end_date=None):
+    """在已排序的周次陣列上二分搜尋，回傳 [i, j) 範圍 (結束日整天都算在內)"""
+    i = 0 if start_date is None else int(np.searchsorted(sorted_weeks, _to_day_start(start_date), side='left'))
+    if end_date is None:
+        j = len(sorted_weeks)
+    else:
+        end = _to_day_start(end_date) + np.timedelta64(1, 'D')
+        j = int(np.searchsorted(sorted_weeks, end, side='left'))
+    return i, max(i, j)
+
+
+def sort_by_week(df):
+    """依周次排序 (穩定排序，同一周維持原本順序)；已排序就原樣回傳"""
+    if df['周次'].is_monotonic_increasing:
+        return df
+    return df.sort_values('周次', kind='stable').reset_index(drop=True)
+
+
+class TimeIndex:
+    """依周次排序的資料的時間索引：日期區間用二分搜尋切片，不必逐列比較日期"""
+
+    def __init__(self, df):
+        self.values = df['周次'].to_numpy()
+        if len(self.values) > 1 and (self.values[1:] < self.values[:-1]).any():
+            raise ValueError("TimeIndex 需要依周次排序的資料 (請先呼叫 sort_by_week)")
+        self.week_values = np.unique(self.values)
+        self.weeks = [pd.Timestamp(w).date() for w in self.week_values]
+
+    def bounds(self, start_date, end_date):
+        return period_bounds(self.values, start_date, end_date)
+
+    def count_weeks(self, start_date, end_date):
+        """區間內有幾個不同的周次"""
+        i, j = period_bounds(self.week_values, start_date, end_date)
+        return j - i
+
+    def slice(self, df, start_date, end_date):
+        """回傳區間內的連續切片 (iloc 切片，不逐列建立遮罩)"""
+        i, j = self.bounds(start_date, end_date)
+        return df.iloc[i:j]
+
+
+class WeekCube:
+    """玩家 × 周次 的前綴和矩陣
+
+    每個活動欄位存一份 (玩家數, 周數 + 1) 的累加陣列，第 0 欄是 0；
+    任何 [開始, 結束] 區間的總和 = cum[:, j] - cum[:, i]，每位玩家只要兩次查表。
+    """
+
+    def __init__(self, df):
+        weeks = np.sort(df['周次'].dropna().unique())
+        players, player_codes = np.unique(df['暱稱'].astype(str).to_numpy(), return_inverse=True)
+        week_codes = np.searchsorted(weeks, df['周次'].to_numpy())
+
+        self.weeks = weeks
+        self.players = pd.Index(players, name='暱稱')
+        n_players, n_weeks = len(players), len(weeks)
+        flat = player_codes * n_weeks + week_codes
+
+        def cumulative(grid):
+            grid = grid.reshape(n_players, n_weeks)
+            out = np.zeros((n_players, n_weeks + 1), dtype=grid.dtype)
+            np.cumsum(grid, axis=1, out=out[:, 1:])
+            return out
+
+        size = n_players * n_weeks
+        self.cum = {
+            col: cumulative(np.bincount(flat, weights=df[col].to_numpy(dtype='float64'), minlength=size))
+            for col in ACTIVITY_COLS
+        }
+        # 出席周數：同一周有幾筆都只算一次 (等同 groupby 的 '周次': 'nunique')
+        presence = (np.bincount(flat, minlength=size) > 0).astype('int64')
+        self.cum['周次'] = cumulative(presence)
+
+        # 職業 / 圖片取區間內第一筆有值的資料 (等同 groupby 的 'first')
+        self.first_codes = {}
+        self.first_values = {}
+        for col in ['職業', '圖片']:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col])
+            picked = pd.DataFrame({'flat': flat, 'code': codes})
+            picked = picked[picked['code'] >= 0].drop_duplicates('flat', keep='first')
+            grid = np.full(n_players * n_weeks, -1, dtype='int64')
+            grid[picked['flat'].to_numpy()] = picked['code'].to_numpy()
+            self.first_codes[col] = grid.reshape(n_players, n_weeks)
+            self.first_values[col] = np.asarray(uniques, dtype=object)
+
+    def week_bounds(self, start_date, end_date):
+        """日期區間 -> 周次的 [i, j) 欄位範圍 (結束日整天都算在內)"""
+        return period_bounds(self.weeks, start_date, end_date)
+
+    def range_totals(self, start_date, end_date):
+        """區間內每位玩家的 旗幟戰 / 地下水道 / 公會城每周 總和、出席周數、職業、圖片
+        只包含區間內有資料的玩家，結果與 df_period.groupby('暱稱').agg(...) 相同
+        """
+        i, j = self.week_bounds(start_date, end_date)
+        data = {}
+        for col in ACTIVITY_COLS + ['周次']:
+            cum = self.cum[col]
+            data[col] = cum[:, j] - cum[:, i]
+        totals = pd.DataFrame(data, index=self.players)
+        for col in ACTIVITY_COLS:
+            totals[col] = totals[col].round().astype('int64')
+
+        for col, grid in self.first_codes.items():
+            window = grid[:, i:j]
+            if window.shape[1] == 0:
+                totals[col] = None
+                continue
+            has_value = window >= 0
+            first_idx = has_value.argmax(axis=1)
+            codes = window[np.arange(len(window)), first_idx]
+            uniques = self.first_values[col]
+            if len(uniques) == 0:
+                totals[col] = None
+                continue
+            values = uniques[np.maximum(codes, 0)]
+            totals[col] = np.where(has_value.any(axis=1), values, None)
+
+        return totals[totals['周次'] > 0]
+
+
+# 活動欄位 -> 排名欄位名稱
+RANK_COLS = {'旗幟戰': 'flag_rank', '地下水道': 'water_rank', '公會城每周': 'castle_rank'}
+
+
+def guild_ranking(cube, start_date, end_date):
+    """全公會排名表：區間總和、平均、公會城出席率與三項活動的名次 (同分同名次)
+
+    排行榜與個人報告共用這張表；索引為暱稱。
+    """
+    return rank_table(cube.range_totals(start_date, end_date))
+
+
+def rank_table(table):
+    """區間總和表 (WeekCube.range_totals 或資料庫彙總的結果) -> 加上平均、出席率與名次"""
+    weeks = table['周次'].to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for col, avg_col in [('旗幟戰', '旗幟戰平均'), ('地下水道', '地下水道平均')]:
+            avg = np.trunc(table[col].to_numpy() / weeks)
+            table[avg_col] = np.where(weeks > 0, avg, 0).astype('int64')
+        pct = np.trunc(table['公會城每周'].to_numpy() / weeks * 10000) / 100
+        table['公會城出席率'] = np.where(weeks > 0, pct, 0.0)
+
+    for col, rank_col in RANK_COLS.items():
+        table[rank_col] = table[col].rank(ascending=False, method='min').astype('int64')
+    return table
+
+
+class RankIndex:
+    """單一活動的排序索引：名次由高到低排好，並記錄每位玩家的位置
+
+    找前後名的玩家只要查位置再取相鄰元素，不必每次重新排序整個公會。
+    """
+
+    def __init__(self, ranking, col):
+        ordered = ranking.sort_values(col, ascending=False, kind='stable')
+        self.col = col
+        self.names = ordered.index.to_numpy(dtype=object)
+        self.scores = ordered[col].to_numpy()
+        self.weeks = ordered['周次'].to_numpy()
+        self.ranks = ordered[RANK_COLS[col]].to_numpy()
+        self.position = {name: pos for pos, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _row(self, pos):
+        return {'暱稱': self.names[pos], 'score': int(self.scores[pos]),
+                'weeks': int(self.weeks[pos]), 'rank': int(self.ranks[pos])}
+
+    def lookup(self, name):
+        """玩家本身的資料，不在榜上回傳 None"""
+        pos = self.position.get(name)
+        return None if pos is None else self._row(pos)
+
+    def neighbors(self, name, k=1):
+        """回傳 (前面 k 位, 後面 k 位)，兩邊都由近到遠排列；玩家不在榜上回傳 (None, None)"""
+        pos = self.position.get(name)
+        if pos is None:
+            return None, None
+        above = [self._row(p) for p in range(pos - 1, max(pos - k, 0) - 1, -1)]
+        below = [self._row(p) for p in range(pos + 1, min(pos + k, len(self.names) - 1) + 1)]
+        return above, below
+
+
+def build_rank_indexes(ranking):
+    """三項活動各建一份 RankIndex"""
+    return {col: RankIndex(ranking, col) for col in RANK_COLS}
+
+
+def leaderboard_table(ranking, col):
+    """排行榜：依某項活動由高到低排列並加上 名次 欄 (排行榜頁與靜態匯出共用)"""
+    sorted_df = ranking.reset_index().sort_values(by=col, ascending=False).reset_index(drop=True)
+    sorted_df['名次'] = sorted_df.index + 1
+    return sorted_df
+
+
+def format_neighbor_row(row, my_score=None, mode='avg'):
+    """前後名次的一行文字；mode='avg' 顯示平均分數，'pct' 顯示出席率"""
+    score = row['score']; weeks = row['weeks']; real_rank = row['rank']
+    tie_text = " (同分)" if my_score is not None and score == my_score else ""
+    if mode == 'avg':
+        avg_val = int(score / weeks) if weeks > 0 else 0
+        return f"第 {real_rank} 名{tie_text} : {score:,} (均 {avg_val:,})"
+    pct_val = int(float(score / weeks) * 10000) / 100 if weeks > 0 else 0.0
+    return f"第 {real_rank} 名{tie_text} : {score} ({pct_val}%)"
+
+
+def neighbor_text(rank_index, name, mode='avg', k=1, sep="<br>"):
+    """個人卡片上的前後名次文字，回傳 (前面, 後面)；玩家不在榜上回傳 (None, None)"""
+    above, below = rank_index.neighbors(name, k)
+    if above is None:
+        return None, None
+    my_score = rank_index.lookup(name)['score']
+    prev_str = sep.join(f"⬆️ {format_neighbor_row(row, my_score, mode)}" for row in above) if above else "👑 目前第一"
+    next_str = sep.join(f"⬇️ {format_neighbor_row(row, my_score, mode)}" for row in below) if below else "🛡️ 目前墊底"
+    return prev_str, next_str
+
+
+# 原始資料搜尋會比對的欄位 (圖片網址不列入，避免誤中)
+SEARCH_COLS = ['周次', '暱稱', '職業', '等級', '旗幟戰', '地下水道', '公會城每周',
+               '本周是否達成', '近兩周是否達成', '異動與否']
+SEARCH_SEP = '\x1f'
+
+
+class SearchIndex:
+    """原始資料查詢用的全文索引
+
+    每一列預先組成一個小寫字串 (欄位之間用分隔符號隔開)，搜尋時只掃這一欄：
+    - 一般關鍵字：子字串比對 (不分大小寫)
+    - 結尾加 * (例如「陰陽*」)：只比對欄位開頭 (前綴搜尋)
+    """
+
+    def __init__(self, df):
+        parts = []
+        for col in SEARCH_COLS:
+            if col not in df.columns:
+                continue
+            values = df[col]
+            if col == '周次':
+                values = values.dt.strftime('%Y-%m-%d')
+            # 空值先換成空字串：pandas 3 的 astype(str) 會保留 NaN，str.cat 遇到 NaN 整列都會變成 NaN
+            values = values.astype(object).where(values.notna(), '')
+            parts.append(values.astype(str).str.lower())
+        if parts:
+            text = parts[0].str.cat(parts[1:], sep=SEARCH_SEP)
+        else:
+            text = pd.Series('', index=df.index)
+        self.text = SEARCH_SEP + text
+
+    def search(self, query, rows=None):
+        """回傳布林遮罩；rows 為要搜尋的列 (例如日期區間內的 index)，預設全部"""
+        text = self.text if rows is None else self.text.loc[rows]
+        query = str(query).strip().lower()
+        if not query:
+            return pd.Series(True, index=text.index)
+        if query.endswith('*'):
+            needle = SEARCH_SEP + query.rstrip('*')
+        else:
+            needle = query
+        return text.str.contains(needle, regex=False)
+
+
+class LookupIndex:
+    """玩家與職業的查詢索引 (load_data 時建一次)
+
+    - all_players：排序好的全部玩家
+    - players_by_job：職業 -> 排序好的玩家清單
+    - rows_by_player：玩家 -> 該玩家所有資料列的位置 (已依周次排序)
+    """
+
+    def __init__(self, df):
+        names = df['暱稱'].astype(str).to_numpy()
+        weeks = df['周次'].to_numpy()
+        order = np.lexsort((weeks, names))
+        sorted_names = names[order]
+        starts = np.flatnonzero(np.r_[True, sorted_names[1:] != sorted_names[:-1]]) if len(order) else np.array([], dtype='int64')
+        ends = np.r_[starts[1:], len(order)]
+
+        self.all_players = [str(n) for n in sorted_names[starts]]
+        self.rows_by_player = {
+            name: order[s:e] for name, s, e in zip(self.all_players, starts, ends)
+        }
+        self.weeks_by_player = {
+            name: weeks[rows] for name, rows in self.rows_by_player.items()
+        }
+
+        pairs = pd.DataFrame({'職業': df['職業'].astype(str).to_numpy(), '暱稱': names}).drop_duplicates()
+        self.players_by_job = {
+            job: sorted(group['暱稱'].tolist()) for job, group in pairs.groupby('職業', sort=False)
+        }
+
+    def player_rows(self, name, start_date=None, end_date=None):
+        """玩家在日期區間內的資料列位置 (依周次排序)，用二分搜尋切出區間"""
+        rows = self.rows_by_player.get(name)
+        if rows is None:
+            return np.array([], dtype='int64')
+        if start_date is None and end_date is None:
+            return rows
+        i, j = period_bounds(self.weeks_by_player[name], start_date, end_date)
+        return rows[i:j]
+
+
+def player_profile(df_player):
+    """玩家最新的 職業 / 等級 / 圖片 (最新一筆等級是 0 或空白就往前找有等級的那筆)
+
+    等級查不到時回傳 None。
+    """
+    df_sorted = df_player.sort_values('周次', ascending=False)
+    player_info = df_sorted.iloc[0]
+    current_level = player_info.get('等級', 0)
+
+    if pd.to_numeric(current_level, errors='coerce') == 0 or pd.isna(current_level):
+        valid_rows = df_sorted[pd.to_numeric(df_sorted['等級'], errors='coerce') > 0]
+        if not valid_rows.empty:
+            player_info = valid_rows.iloc[0]
+            current_level = player_info.get('等級')
+
+    level = None if str(current_level) in ("0", "nan") else int(float(current_level))
+    job = player_info.get('職業', '未知')
+    return {
+        '職業': '未知' if str(job) == 'nan' else str(job),
+        '等級': level,
+        '圖片': player_info.get('圖片', None),
+    }
+
+
+CHANGE_TYPES = ['升階', '降階']
+CHANGE_STYLES = {
+    '升階': 'background-color: #006000; color: #00EC00; font-weight: bold;',
+    '降階': 'background-color: #800000; color: #F08080; font-weight: bold;',
+}
+
+
+def _join_notes(parts, sep=' / '):
+    """把多個字串欄位 (空字串代表沒有) 用分隔符號串起來，整批處理"""
+    note = pd.Series('', index=parts[0].index)
+    for part in parts:
+        glue = np.where((note != '') & (part != ''), sep, '')
+        note = note + glue + part
+    return note
+
+
+class ChangeLog:
+    """全公會的升降階紀錄 (每個資料版本整批算一次)
+
+    events 欄位：周次、暱稱、職業、異動與否、三項活動分數、備註、貢獻活動；依周次新到舊排列。
+    """
+
+    def __init__(self, df):
+        if '異動與否' not in df.columns:
+            self.events = pd.DataFrame(columns=['周次', '暱稱', '職業', '異動與否', '備註', '貢獻活動'])
+            self._rows = {}
+            return
+
+        events = df[df['異動與否'].isin(CHANGE_TYPES)]
+        cols = ['周次', '暱稱', '職業', '異動與否'] + ACTIVITY_COLS
+        events = events[cols].sort_values('周次', ascending=False, kind='stable').reset_index(drop=True)
+        events['暱稱'] = events['暱稱'].astype(str)
+        events['職業'] = events['職業'].astype(str)
+
+        water = events['地下水道'].to_numpy()
+        flag = events['旗幟戰'].to_numpy()
+        castle = events['公會城每周'].to_numpy()
+        water_txt = pd.Series(np.where(water > 0, '地下水道' + pd.Series(water).astype('int64').astype(str) + '分', ''))
+        flag_txt = pd.Series(np.where(flag > 0, '旗幟' + pd.Series(flag).astype('int64').astype(str) + '分', ''))
+        castle_txt = pd.Series(np.where(castle > 0, '公會城每周達成', ''))
+
+        note = _join_notes([water_txt, flag_txt, castle_txt])
+        events['備註'] = note.where(note != '', '近兩周未有記錄').to_numpy()
+        events['貢獻活動'] = _join_notes([
+            pd.Series(np.where(water > 0, '地下水道', '')),
+            pd.Series(np.where(flag > 0, '旗幟戰', '')),
+            pd.Series(np.where(castle > 0, '公會城', '')),
+        ], sep='、').to_numpy()
+
+        self.events = events
+        # 玩家 -> 該玩家的事件列位置 (已是新到舊)
+        self._rows = {name: rows for name, rows in events.groupby('暱稱', sort=False).indices.items()}
+
+    def for_player(self, name, start_date=None, end_date=None):
+        """單一玩家在區間內的升降階紀錄 (新到舊)"""
+        rows = self._rows.get(name)
+        if rows is None:
+            return self.events.iloc[0:0]
+        player_events = self.events.iloc[rows]
+        if start_date is None and end_date is None:
+            return player_events
+        # 事件是新到舊排列，反過來才能二分搜尋
+        weeks = player_events['周次'].to_numpy()[::-1]
+        i, j = period_bounds(weeks, start_date, end_date)
+        n = len(weeks)
+        return player_events.iloc[n - j:n - i]
+
+    def latest_week(self, start_date=None, end_date=None):
+        """區間內最後一個有升降階紀錄的周次，沒有回傳 None"""
+        weeks = self.events['周次'].to_numpy()[::-1]
+        i, j = period_bounds(weeks, start_date, end_date)
+        return None if j == i else pd.Timestamp(weeks[j - 1])
+
+    def week_report(self, week):
+        """某一周全公會的升階 / 降階名單"""
+        week_events = self.events[self.events['周次'] == week]
+        return {kind: week_events[week_events['異動與否'] == kind].reset_index(drop=True) for kind in CHANGE_TYPES}
+
+
+def change_row_styles(display_df, type_col='變動類型'):
+    """升降階表格的整列底色 (給 Styler.apply(axis=None) 用，一次算完整張表)"""
+    styles = display_df[type_col].map(CHANGE_STYLES).fillna('')
+    return pd.DataFrame(np.repeat(styles.to_numpy()[:, None], display_df.shape[1], axis=1),
+                        index=display_df.index, columns=display_df.columns)
+
+
+def downsample_indices(values, max_points):
+    """長序列降採樣：切成 max_points/2 個區段，每段保留最小與最大值的位置 (保住尖峰)
+
+    回傳排序後的位置陣列；序列不長時原樣回傳全部位置。
+    """
+    n = len(values)
+    if max_points <= 0 or n <= max_points:
+        return np.arange(n)
+    values = np.asarray(values, dtype='float64')
+    buckets = np.array_split(np.arange(n), max(1, max_points // 2))
+    keep = {0, n - 1}
+    for bucket in buckets:
+        segment = values[bucket]
+        keep.add(int(bucket[np.argmin(segment)]))
+        keep.add(int(bucket[np.argmax(segment)]))
+    return np.array(sorted(keep))
+
+
+def player_report(name, df, lookups, ranking, rank_indexes, change_log, start_date=None, end_date=None, k=1):
+    """單一玩家在區間內的完整報告 (只含基本型別，可直接轉成 JSON)；區間內沒有資料回傳 None
+
+    內容與網站個人頁相同：角色資料、三項活動的總計 / 名次 / 前後名次、每周紀錄、升降階紀錄。
+    """
+    rows = lookups.player_rows(name, start_date, end_date)
+    if len(rows) == 0 or name not in ranking.index:
+        return None
+    df_player = df.iloc[rows]
+    stats = ranking.loc[name]
+
+    activities = {}
+    for col, rank_col in RANK_COLS.items():
+        above, below = neighbor_text(rank_indexes[col], name, mode='pct' if col == '公會城每周' else 'avg', k=k, sep="\n")
+        activities[col] = {'總計': int(stats[col]), '名次': int(stats[rank_col]), '前面': above, '後面': below}
+
+    weekly_cols = [c for c in ['周次'] + ACTIVITY_COLS + ['本周是否達成', '近兩周是否達成', '異動與否'] if c in df_player.columns]
+    weekly = df_player[weekly_cols].sort_values('周次', ascending=False).copy()
+    weekly['周次'] = weekly['周次'].dt.strftime('%Y-%m-%d')
+    for col in weekly.columns.drop(['周次'] + ACTIVITY_COLS, errors='ignore'):
+        # 空值先換成空字串 (pandas 3 的 astype(str) 會保留 NaN，輸出的 JSON 會變成不合法的 NaN)
+        weekly[col] = weekly[col].astype(object).where(weekly[col].notna(), '').astype(str)
+
+    changes = change_log.for_player(name, start_date, end_date)
+    profile = player_profile(df_player)
+    return {
+        '暱稱': name,
+        '職業': profile['職業'],
+        '等級': profile['等級'],
+        '圖片': None if pd.isna(profile['圖片']) or str(profile['圖片']) in ('nan', 'None', '') else str(profile['圖片']),
+        '統計週數': int(stats['周次']),
+        '旗幟戰平均': int(stats['旗幟戰平均']),
+        '地下水道平均': int(stats['地下水道平均']),
+        '公會城出席率': float(stats['公會城出席率']),
+        '活動': activities,
+        '每周紀錄': [{k2: (int(v) if k2 in ACTIVITY_COLS else v) for k2, v in rec.items()} for rec in weekly.to_dict('records')],
+        '升降階紀錄': [
+            {'周次': w.strftime('%Y-%m-%d'), '異動與否': str(t), '備註': str(n)}
+            for w, t, n in zip(changes['周次'], changes['異動與否'], changes['備註'])
+        ],
+    }
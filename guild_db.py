@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import pandas as pd
+import guild_store
+import guild_compute
+
+# ================= 設定區 =================
+# 選用的 SQLite 資料庫 (update_tool.py --database 產生)，網站設定 GUILD_BACKEND = "sqlite" 才會使用
+DB_FILE = os.environ.get("GUILD_DB", "guild_data.db")
+# =========================================
+
+TABLE = "guild_weekly"
+TEXT_COLS = ['暱稱', '本周是否達成', '近兩周是否達成', '異動與否', '職業', '圖片']
+
+
+def write_database(df, path=DB_FILE):
+    """把整理好的公會資料寫成 SQLite (先寫暫存檔再替換，網站不會讀到寫一半的檔案)
+
+    row_id 保留原本的資料順序；索引：(暱稱, 周次) 給個人查詢、(周次) 給日期區間與彙總。
+    """
+    df = guild_store.normalize_guild_df(df)
+    out = df.copy()
+    out['周次'] = out['周次'].dt.strftime('%Y-%m-%d')   # ISO 字串排序就是日期順序
+    for col in TEXT_COLS:
+        if col in out.columns:
+            out[col] = out[col].astype(object).where(out[col].notna(), None)
+            out[col] = out[col].map(lambda v: None if v is None else str(v))
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        col_defs = ", ".join(
+            f'"{col}" INTEGER' if col in guild_store.SCORE_COLS or col == '等級' else f'"{col}" TEXT'
+            for col in out.columns
+        )
+        conn.execute(f"CREATE TABLE {TABLE} (row_id INTEGER PRIMARY KEY, {col_defs})")
+        placeholders = ", ".join("?" for _ in range(len(out.columns) + 1))
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {TABLE} VALUES ({placeholders})",
+                ((i, *row) for i, row in enumerate(out.itertuples(index=False, name=None))),
+            )
+            conn.execute(f'CREATE INDEX idx_player_week ON {TABLE} ("暱稱", "周次")')
+            conn.execute(f'CREATE INDEX idx_week ON {TABLE} ("周次")')
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return True
+
+
+def data_version(path=DB_FILE):
+    """資料庫的版本代號 (修改時間與大小)，給快取當 key"""
+    if not os.path.exists(path):
+        return "none"
+    stat = os.stat(path)
+    return f"db-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _connect(path=DB_FILE):
+    # 網站只讀不寫：用唯讀模式開啟，多個 worker 同時讀也不會互相鎖住
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def _query(sql, params=(), path=DB_FILE):
+    conn = _connect(path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+
+def _day(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def _to_frame(df):
+    """SQL 查詢結果 -> 與 guild_store.read_guild_data 相同的型別"""
+    df = df.drop(columns=['row_id'], errors='ignore')
+    df['周次'] = pd.to_datetime(df['周次'])
+    for col in guild_store.SCORE_COLS:
+        df[col] = df[col].fillna(0).astype('int64')
+    for col in guild_store.CATEGORY_COLS:
+        df[col] = df[col].astype(str).astype('category')
+    return df.reset_index(drop=True)
+
+
+def list_weeks(path=DB_FILE):
+    """所有出現過的周次 (date，已排序)；只掃 周次 索引"""
+    weeks = _query(f'SELECT DISTINCT "周次" FROM {TABLE} ORDER BY "周次"', path=path)['周次']
+    return [pd.Timestamp(w).date() for w in weeks]
+
+
+def player_directory(path=DB_FILE):
+    """(全部玩家, 職業 -> 玩家清單)，給選單用，不必載入資料列"""
+    pairs = _query(f'SELECT DISTINCT "暱稱", "職業" FROM {TABLE} WHERE "職業" IS NOT NULL', path=path)
+    all_players = sorted(pairs['暱稱'].astype(str).unique().tolist())
+    players_by_job = {job: sorted(group['暱稱'].tolist()) for job, group in pairs.groupby('職業', sort=False)}
+    return all_players, players_by_job
+
+
+def read_period(start_date, end_date, path=DB_FILE):
+    """只讀取 [開始, 結束] 區間內的資料列 (用 周次 索引，依周次排序)"""
+    df = _query(
+        f'SELECT * FROM {TABLE} WHERE "周次" BETWEEN ? AND ? ORDER BY "周次", row_id',
+        (_day(start_date), _day(end_date)), path,
+    )
+    return _to_frame(df)
+
+
+def read_player(name, start_date, end_date, path=DB_FILE):
+    """單一玩家在區間內的資料列 (用 (暱稱, 周次) 索引)"""
+    df = _query(
+        f'SELECT * FROM {TABLE} WHERE "暱稱" = ? AND "周次" BETWEEN ? AND ? ORDER BY "周次", row_id',
+        (name, _day(start_date), _day(end_date)), path,
+    )
+    return _to_frame(df)
+
+
+def range_totals(start_date, end_date, path=DB_FILE):
+    """區間內每位玩家的活動總和、出席周數、第一筆職業 / 圖片 (直接在 SQLite 裡 GROUP BY)
+
+    結果與 guild_compute.WeekCube.range_totals 相同。
+    """
+    first = (
+        '(SELECT "{col}" FROM ' + TABLE + ' f WHERE f."暱稱" = g."暱稱" AND f."周次" BETWEEN ?1 AND ?2'
+        ' AND f."{col}" IS NOT NULL ORDER BY f."周次", f.row_id LIMIT 1) AS "{col}"'
+    )
+    sql = (
+        'SELECT "暱稱", SUM("旗幟戰") AS "旗幟戰", SUM("地下水道") AS "地下水道",'
+        ' SUM("公會城每周") AS "公會城每周", COUNT(DISTINCT "周次") AS "周次", '
+        + first.format(col='職業') + ', ' + first.format(col='圖片')
+        + f' FROM {TABLE} g WHERE "周次" BETWEEN ?1 AND ?2 GROUP BY "暱稱" ORDER BY "暱稱"'
+    )
+    totals = _query(sql, (_day(start_date), _day(end_date)), path).set_index('暱稱')
+    for col in guild_compute.ACTIVITY_COLS + ['周次']:
+        totals[col] = totals[col].fillna(0).astype('int64')
+    return totals
+
+
+def guild_ranking(start_date, end_date, path=DB_FILE):
+    """全公會排名表 (彙總在資料庫裡做，排名規則與 guild_compute.guild_ranking 相同)"""
+    return guild_compute.rank_table(range_totals(start_date, end_date, path))
@@ -0,0 +1,368 @@
+import io
+import os
+import json
+import hashlib
+import threading
+import pandas as pd
+
+# ================= 設定區 =================
+CSV_FILE = "guild_data.csv"            # 原本給網站用的 CSV (保留，方便人工檢查)
+COLUMNAR_FILE = "guild_data.parquet"   # 型別化的欄式檔案，網站優先讀這個
+EXCEL_CACHE_DIR = ".cache"             # data.xlsx 解析結果的快取資料夾
+PARTITION_DIR = "guild_data_parts"     # 依日期分割的資料 (update_tool --partitions 產生)
+PARTITION_BY = "month"                 # 分割方式："month" = 每月一個檔、"quarter" = 每季一個檔
+# =========================================
+
+SCORE_COLS = ['旗幟戰', '地下水道', '公會城每周']
+CATEGORY_COLS = ['暱稱', '職業', '本周是否達成']
+
+# 與 pd.read_excel 預設相同的空值字串，讓串流讀取的結果和原本一致
+EXCEL_NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+}
+
+def has_columnar_support():
+    """是否有安裝 pyarrow (沒有就只輸出 CSV)"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def normalize_guild_df(df):
+    """把原始資料轉成網站要用的型別：日期、整數分數、類別字串"""
+    df = df.dropna(how='all')
+    df = df.dropna(subset=['職業']).copy()
+    df['職業'] = df['職業'].astype(str)
+    df['暱稱'] = df['暱稱'].astype(str)
+
+    df['周次'] = pd.to_datetime(df['周次'])
+    for col in SCORE_COLS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int64')
+
+    df['本周是否達成'] = df['本周是否達成'].astype(str).str.strip()
+
+    # 重複度高的字串欄位改成 category，省記憶體也讓 groupby 更快
+    for col in CATEGORY_COLS:
+        df[col] = df[col].astype('category')
+
+    # 依周次排序 (穩定排序)，網站可以直接用二分搜尋切日期區間
+    return df.sort_values('周次', kind='stable').reset_index(drop=True)
+
+def write_columnar(df, path=COLUMNAR_FILE):
+    """另存一份型別化的 Parquet，回傳是否成功 (沒裝 pyarrow 就跳過)"""
+    if not has_columnar_support():
+        print("ℹ️ 未安裝 pyarrow，略過 Parquet 輸出 (pip install pyarrow)")
+        return False
+    normalize_guild_df(df).to_parquet(path, index=False)
+    return True
+
+def read_guild_data(csv_path=CSV_FILE, columnar_path=COLUMNAR_FILE):
+    """讀取公會資料：Parquet 存在且不比 CSV 舊就直接用 (記憶體映射讀取)，否則讀 CSV 再整理型別"""
+    if has_columnar_support() and os.path.exists(columnar_path):
+        csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else 0
+        if os.path.getmtime(columnar_path) >= csv_mtime:
+            return pd.read_parquet(columnar_path, memory_map=True)
+
+    return normalize_guild_df(pd.read_csv(csv_path))
+
+def data_version(csv_path=CSV_FILE, columnar_path=COLUMNAR_FILE):
+    """資料版本代號：資料檔的修改時間與大小，檔案一變代號就不同 (給快取當 key)"""
+    parts = []
+    for path in (csv_path, columnar_path):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+        else:
+            parts.append("none")
+    return "/".join(parts)
+
+class GuildDataSource:
+    """依檔案變動重新讀取公會資料 (取代固定 TTL 整份重讀)
+
+    - 檔案的修改時間與大小都沒變：直接沿用上次的結果，只花一次 os.stat
+    - 內容雜湊沒變 (只是被碰過)：不重新解析，版本代號也不變
+    - CSV 只在尾端新增資料列：只解析新增的部分，接在舊資料後面
+    - 其他情況才整份重讀
+    版本代號由內容雜湊產生，給下游所有快取當 key。
+    """
+
+    def __init__(self, csv_path=CSV_FILE, columnar_path=COLUMNAR_FILE):
+        self.csv_path = csv_path
+        self.columnar_path = columnar_path
+        self.lock = threading.Lock()
+        self.stat_key = None      # data_version() 的結果，判斷檔案有沒有動過
+        self.source = None        # 目前讀的是 'csv' 還是 'parquet'
+        self.digest = None        # 已讀入內容的 SHA-256
+        self.offset = 0           # CSV 已解析到的位元組位置
+        self.header = b""         # CSV 標題列 (解析新增資料列時要補上)
+        self.df = None
+        self.version = None
+
+    def _pick_source(self):
+        if has_columnar_support() and os.path.exists(self.columnar_path):
+            csv_mtime = os.path.getmtime(self.csv_path) if os.path.exists(self.csv_path) else 0
+            if os.path.getmtime(self.columnar_path) >= csv_mtime:
+                return 'parquet'
+        return 'csv'
+
+    def _load_parquet(self):
+        digest = _file_sha256(self.columnar_path)
+        if self.source == 'parquet' and digest == self.digest:
+            return False
+        self.df = pd.read_parquet(self.columnar_path, memory_map=True)
+        self.source, self.digest = 'parquet', digest
+        return True
+
+    def _load_csv(self):
+        with open(self.csv_path, 'rb') as f:
+            content = f.read()
+
+        can_append = (
+            self.source == 'csv' and self.df is not None
+            and len(content) >= self.offset
+            and content[self.offset - 1:self.offset] == b"\n"
+            and hashlib.sha256(content[:self.offset]).hexdigest() == self.digest
+        )
+        if can_append:
+            tail = content[self.offset:]
+            if not tail.strip():
+                return False
+            # 舊內容完全沒變，只多了尾端的資料列：只解析新增的部分
+            new_rows = normalize_guild_df(pd.read_csv(io.BytesIO(self.header + tail)))
+            df = pd.concat([self.df, new_rows], ignore_index=True)
+            for col in CATEGORY_COLS:
+                df[col] = df[col].astype(str).astype('category')
+            if len(new_rows) and len(self.df) and new_rows['周次'].min() < self.df['周次'].max():
+                df = df.sort_values('周次', kind='stable').reset_index(drop=True)
+            self.df = df
+        else:
+            self.df = normalize_guild_df(pd.read_csv(io.BytesIO(content)))
+            self.header = content[:content.find(b"\n") + 1]
+
+        self.source = 'csv'
+        self.offset = len(content)
+        self.digest = hashlib.sha256(content).hexdigest()
+        return True
+
+    def refresh(self):
+        """檢查檔案有沒有變，有變才重新讀取；回傳 (版本代號, DataFrame)"""
+        with self.lock:
+            stat_key = data_version(self.csv_path, self.columnar_path)
+            if stat_key != self.stat_key or self.df is None:
+                if self._pick_source() == 'parquet':
+                    changed = self._load_parquet()
+                else:
+                    changed = self._load_csv()
+                self.stat_key = stat_key
+                if changed or self.version is None:
+                    self.version = f"{self.source}-{self.digest[:16]}"
+            return self.version, self.df
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _parse_excel_streaming(path):
+    """用 openpyxl 唯讀模式逐列讀取第一個工作表 (不把整個活頁簿載入記憶體)"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        records = [
+            tuple(None if isinstance(v, str) and v in EXCEL_NA_VALUES else v for v in row)
+            for row in rows
+        ]
+    finally:
+        wb.close()
+
+    df = pd.DataFrame.from_records(records, columns=list(header))
+    return df.dropna(how='all').infer_objects().reset_index(drop=True)
+
+def read_source_excel(path, cache_dir=EXCEL_CACHE_DIR):
+    """讀取手動維護的 Excel，解析結果依 (修改時間, 大小, SHA-256) 快取
+    update_tool.py 與 repair_job.py 共用，檔案沒變就不會再解析第二次
+    """
+    stat = os.stat(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.join(cache_dir, os.path.basename(path))
+    meta_path, data_path = base + ".meta.json", base + ".pkl"
+
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(data_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+    if meta:
+        # 1. 修改時間與大小都一樣：不用讀檔，直接用快取
+        if meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size:
+            return pd.read_pickle(data_path)
+
+    digest = _file_sha256(path)
+    if meta and meta.get('sha256') == digest:
+        # 2. 只是被碰過 (例如複製檔案)，內容沒變：更新時間戳後沿用快取
+        meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return pd.read_pickle(data_path)
+
+    # 3. 內容有變：重新解析並寫入快取
+    df = _parse_excel_streaming(path)
+    df.to_pickle(data_path)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest}, f)
+    return df
+
+
+# 依日期分割的資料：每月 / 每季一個 Parquet 檔加上 manifest，網站只讀取與日期區間重疊的分割
+PARTITION_MANIFEST = "manifest.json"
+
+
+def _partition_keys(weeks, by=PARTITION_BY):
+    if by == "quarter":
+        return weeks.dt.year.astype(str) + "-Q" + weeks.dt.quarter.astype(str)
+    return weeks.dt.strftime('%Y-%m')
+
+def load_partition_manifest(root=PARTITION_DIR):
+    path = os.path.join(root, PARTITION_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_partitions(df, root=PARTITION_DIR, by=PARTITION_BY):
+    """把公會資料依月 (或季) 分割存檔，並寫入各分割 周次 最小 / 最大值的 manifest.json
+
+    內容沒變的分割不會重寫 (舊賽季的檔案保持不動)，回傳 (重寫的檔案數, 分割總數)。
+    """
+    df = normalize_guild_df(df)
+    os.makedirs(root, exist_ok=True)
+    old = load_partition_manifest(root)
+    old_parts = {p['key']: p for p in old.get('partitions', [])} if old.get('by') == by else {}
+    ext = ".parquet" if has_columnar_support() else ".csv"
+
+    partitions, written = [], 0
+    for key, part in df.groupby(_partition_keys(df['周次'], by), sort=True):
+        part = part.reset_index(drop=True)
+        digest = hashlib.sha256(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes()).hexdigest()
+        file_name = f"{key}{ext}"
+        prev = old_parts.get(key)
+        if not prev or prev.get('digest') != digest or prev.get('file') != file_name \
+                or not os.path.exists(os.path.join(root, file_name)):
+            path = os.path.join(root, file_name)
+            if ext == ".parquet":
+                part.to_parquet(path, index=False)
+            else:
+                part.to_csv(path, index=False, encoding='utf-8-sig')
+            written += 1
+        partitions.append({
+            'key': key, 'file': file_name, 'rows': len(part), 'digest': digest,
+            'min_week': part['周次'].min().strftime('%Y-%m-%d'),
+            'max_week': part['周次'].max().strftime('%Y-%m-%d'),
+        })
+
+    # 已經不存在的分割 (例如改了分割方式) 把舊檔刪掉
+    current_files = {p['file'] for p in partitions}
+    for p in old.get('partitions', []):
+        if p.get('file') not in current_files and os.path.exists(os.path.join(root, p['file'])):
+            os.remove(os.path.join(root, p['file']))
+
+    pairs = pd.DataFrame({'職業': df['職業'].astype(str), '暱稱': df['暱稱'].astype(str)}).drop_duplicates()
+    manifest = {
+        'by': by,
+        'version': hashlib.sha256("".join(p['digest'] for p in partitions).encode()).hexdigest()[:16],
+        'partitions': partitions,
+        # 玩家選單用的名單，網站不必載入任何分割就能列出所有玩家
+        'players_by_job': {job: sorted(g['暱稱'].tolist()) for job, g in pairs.groupby('職業', sort=True)},
+    }
+    tmp_path = os.path.join(root, PARTITION_MANIFEST + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(root, PARTITION_MANIFEST))
+    return written, len(partitions)
+
+
+class PartitionedGuildData:
+    """依日期分割的公會資料：只讀與日期區間重疊的分割，區間變大時才陸續載入其他分割
+
+    已載入的分割會留在記憶體 (內容雜湊沒變就不重讀)，所有 session 共用。
+    """
+
+    def __init__(self, root=PARTITION_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        self.manifest = {}
+        self.manifest_stat = None
+        self.loaded = {}          # key -> (digest, DataFrame)
+
+    def refresh(self):
+        """manifest 有變才重新讀取，並丟掉內容已改變的分割；回傳版本代號"""
+        with self.lock:
+            path = os.path.join(self.root, PARTITION_MANIFEST)
+            stat = os.stat(path)
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if stat_key != self.manifest_stat:
+                self.manifest = load_partition_manifest(self.root)
+                self.manifest_stat = stat_key
+                digests = {p['key']: p['digest'] for p in self.manifest.get('partitions', [])}
+                self.loaded = {k: v for k, v in self.loaded.items() if digests.get(k) == v[0]}
+            return f"parts-{self.manifest.get('version', 'none')}"
+
+    def date_bounds(self):
+        """(最早周次, 最晚周次)，直接取自 manifest"""
+        parts = self.manifest.get('partitions', [])
+        if not parts:
+            return None, None
+        return (pd.Timestamp(min(p['min_week'] for p in parts)).date(),
+                pd.Timestamp(max(p['max_week'] for p in parts)).date())
+
+    def players(self):
+        """(全部玩家, 職業 -> 玩家清單)"""
+        players_by_job = self.manifest.get('players_by_job', {})
+        all_players = sorted({name for names in players_by_job.values() for name in names})
+        return all_players, players_by_job
+
+    def overlapping(self, start_date, end_date):
+        """與 [開始, 結束] 重疊的分割代號 (依時間排序)"""
+        start, end = str(pd.Timestamp(start_date).date()), str(pd.Timestamp(end_date).date())
+        return tuple(p['key'] for p in self.manifest.get('partitions', [])
+                     if p['min_week'] <= end and p['max_week'] >= start)
+
+    def _load(self, part):
+        path = os.path.join(self.root, part['file'])
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path, memory_map=True)
+        return normalize_guild_df(pd.read_csv(path))
+
+    def read(self, keys):
+        """載入指定的分割 (已載入的直接沿用) 並依周次接成一份資料"""
+        with self.lock:
+            parts = {p['key']: p for p in self.manifest.get('partitions', [])}
+            frames = []
+            for key in keys:
+                part = parts[key]
+                if key not in self.loaded:
+                    self.loaded[key] = (part['digest'], self._load(part))
+                frames.append(self.loaded[key][1])
+
+        if not frames:
+            return normalize_guild_df(pd.DataFrame(columns=['周次', '暱稱', '職業', '本周是否達成'] + SCORE_COLS))
+        df = pd.concat(frames, ignore_index=True)
+        # 各分割的類別不同，接起來後重新轉成 category
+        for col in CATEGORY_COLS:
+            df[col] = df[col].astype(str).astype('category')
+        return df
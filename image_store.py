@@ -0,0 +1,170 @@
+import os
+import io
+import json
+import base64
+import hashlib
+import mimetypes
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import nexon_client
+
+# ================= 設定區 =================
+# 角色圖片存放位置 (跟 guild_data.csv 一起上傳)；放在 static/ 底下，網站用 Streamlit 靜態檔案服務直接提供
+# (.streamlit/config.toml 要開 enableStaticServing)，瀏覽器可以快取，不必每次 rerun 重送整張圖
+IMAGE_DIR = "static/images"
+STATIC_DIR = "static"
+STATIC_URL_PREFIX = "app/static"                       # Streamlit 靜態檔案的網址前綴
+STATIC_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}   # Streamlit 會用正確 content type 提供的圖片格式
+MANIFEST_FILE = os.path.join(IMAGE_DIR, "manifest.json")
+THUMB_WIDTH = 160                                      # 縮圖寬度 (排行榜頒獎台最大顯示 150px)
+DOWNLOAD_WORKERS = 4                                   # 同時下載幾張圖
+# =========================================
+
+
+# 圖片格式 (開頭的識別位元組) -> (content type, 副檔名)
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"GIF87a", "image/gif", ".gif"),
+    (b"GIF89a", "image/gif", ".gif"),
+]
+# 有些系統 (例如舊版 Windows) 的 mimetypes 沒有 .webp，縮圖一律是 webp
+mimetypes.add_type("image/webp", ".webp")
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """網址 -> {sha256, etag, file, content_type, thumb, checked_at}"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _content_path(digest, ext):
+    # 依內容雜湊命名：同一張圖不論來自幾個網址只存一份
+    # (manifest 裡一律用 / 分隔，Windows 產生的圖庫上傳到網站也能用)
+    return f"{IMAGE_DIR}/{digest[:2]}/{digest}{ext}"
+
+def _detect_type(content, header_type):
+    """依檔案內容判斷圖片格式，回傳 (content type, 副檔名)；認不出來才相信伺服器的 Content-Type"""
+    for signature, mime, ext in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return mime, ext
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    mime = (header_type or "").split(";")[0].strip().lower()
+    if mime.startswith("image/"):
+        return mime, mimetypes.guess_extension(mime) or ".img"
+    return "application/octet-stream", ".img"
+
+def _make_thumbnail(content, digest):
+    """產生縮圖 (需要 Pillow，沒裝就跳過)，回傳檔案路徑或 None"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    thumb_path = f"{IMAGE_DIR}/thumbs/{digest}.webp"
+    if os.path.exists(thumb_path):
+        return thumb_path
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            img = img.convert("RGBA")
+            if img.width > THUMB_WIDTH:
+                height = max(1, round(img.height * THUMB_WIDTH / img.width))
+                img = img.resize((THUMB_WIDTH, height), Image.LANCZOS)
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            img.save(thumb_path, "WEBP", quality=85, method=6)
+    except Exception:
+        return None
+    return thumb_path
+
+def _sync_one(url, entry):
+    """下載單一圖片；有舊的 ETag 就帶 If-None-Match，沒變的話伺服器回 304 不用重抓
+    回傳 (狀態, 新的 manifest 項目)
+    """
+    # 共用的 Session 預設 accept: application/json (給 API 用)，下載圖片要改成要圖片
+    headers = {'Accept': 'image/*'}
+    if entry and entry.get('etag') and os.path.exists(entry.get('file', '')):
+        headers['If-None-Match'] = entry['etag']
+
+    try:
+        resp = nexon_client.get_session().get(url, headers=headers, timeout=nexon_client.TIMEOUT)
+    except requests.RequestException:
+        return "failed", entry
+
+    if resp.status_code == 304 and entry:
+        return "unchanged", dict(entry, checked_at=time.time())
+    if resp.status_code != 200 or not resp.content:
+        return "failed", entry
+
+    content = resp.content
+    digest = hashlib.sha256(content).hexdigest()
+    content_type, ext = _detect_type(content, resp.headers.get('Content-Type'))
+    file_path = _content_path(digest, ext)
+    if not os.path.exists(file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+
+    new_entry = {
+        'sha256': digest,
+        'etag': resp.headers.get('ETag'),
+        'file': file_path,
+        'content_type': content_type,
+        'thumb': _make_thumbnail(content, digest),
+        'checked_at': time.time(),
+    }
+    status = "unchanged" if entry and entry.get('sha256') == digest else "downloaded"
+    return status, new_entry
+
+def sync_images(urls):
+    """把角色圖片同步到本機圖庫，回傳 {downloaded, unchanged, failed} 計數"""
+    manifest = load_manifest()
+    urls = sorted({str(u).strip() for u in urls if u and str(u) != "nan" and str(u).strip()})
+    counts = {"downloaded": 0, "unchanged": 0, "failed": 0}
+    if not urls:
+        return counts
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        results = executor.map(lambda u: (u, _sync_one(u, manifest.get(u))), urls)
+        for url, (status, entry) in results:
+            counts[status] += 1
+            if entry:
+                manifest[url] = entry
+
+    save_manifest(manifest)
+    return counts
+
+def local_image(url, manifest, thumb=True):
+    """網址 -> 本機檔案路徑 (優先縮圖)，圖庫裡沒有就回傳 None"""
+    entry = manifest.get(str(url).strip()) if url else None
+    if not entry:
+        return None
+    for path in ([entry.get('thumb')] if thumb else []) + [entry.get('file')]:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+def data_uri(path):
+    """本機圖片 -> data URI (給 HTML <img> 直接嵌入)；content type 依副檔名 (下載時已依實際格式命名)"""
+    mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    with open(path, 'rb') as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+def static_url(path):
+    """本機圖片 -> Streamlit 靜態檔案網址；不在 static/ 底下或格式不支援就回傳 None"""
+    norm = path.replace(os.sep, "/")
+    if not norm.startswith(STATIC_DIR + "/") or os.path.splitext(norm)[1].lower() not in STATIC_EXTENSIONS:
+        return None
+    return f"{STATIC_URL_PREFIX}/{norm[len(STATIC_DIR) + 1:]}"
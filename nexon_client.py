@@ -0,0 +1,248 @@
+import time
+import threading
+import email.utils
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import api_cache
+
+# ================= 設定區 =================
+API_BASE = "https://open.api.nexon.com/maplestorytw/v1"
+TIMEOUT = (5, 15)              # (連線, 讀取) 逾時秒數
+MAX_RETRIES = 4                # 429 / 5xx / 連線錯誤最多重試幾次
+BACKOFF_BASE = 0.5             # 指數退避：0.5, 1, 2, 4 秒...
+BACKOFF_MAX = 30               # 單次最多等幾秒
+POOL_SIZE = 16                 # keep-alive 連線池大小
+CHARACTER_FRESH_SECONDS = 6 * 3600   # 角色基本資料超過這麼久就在背景重新查詢 (先回傳舊資料)
+NEGATIVE_TTL = 600             # 「查無角色」只記 10 分鐘，改名回來或新角色很快就查得到
+FAILED_TTL = 60                # 「暫時失敗」只記 1 分鐘，API 忙碌時每次重新整理不會再排隊重查
+REFRESH_WORKERS = 2            # 背景更新用的執行緒數
+# =========================================
+
+# 查詢結果狀態：把「查無此人」和「暫時失敗」分開，避免把 API 忙碌寫成 等級=0 / 職業=未知
+OK = "ok"
+NOT_FOUND = "not_found"        # OPENAPI00003 (識別碼無效)：角色不存在 (改名或刪角)
+FAILED = "failed"              # 其他錯誤 (API key、參數、資料準備中、維護、429 / 5xx / 逾時)，不代表角色不存在
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Nexon 的 400 也用在 API key 無效、參數錯誤、資料準備中、維護，要看 error.name 才知道是不是查無角色
+NOT_FOUND_ERRORS = {"OPENAPI00003"}
+
+
+def _error_name(resp):
+    """Nexon 錯誤回應的 error.name (例如 OPENAPI00003)，解析不到回傳 None"""
+    try:
+        error = resp.json().get("error") or {}
+    except (ValueError, AttributeError):
+        return None
+    return error.get("name") if isinstance(error, dict) else None
+
+
+class TokenBucket:
+    """權杖桶限速器：每秒補充 rate 個權杖，每次呼叫 API 前先拿一個"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """整個程式共用一個 Session，重複使用 TLS 連線"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.headers.update({"accept": "application/json"})
+            _session = session
+    return _session
+
+def _retry_after_seconds(resp):
+    """解析 Retry-After (秒數或 HTTP 日期)，沒有就回傳 None"""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def get_json(path, params, api_key, limiter=None):
+    """呼叫 Nexon API，回傳 (狀態, JSON 或錯誤訊息)
+    狀態為 OK / NOT_FOUND / FAILED；429、5xx 與連線錯誤會依 Retry-After 或指數退避自動重試
+    """
+    url = f"{API_BASE}{path}"
+    headers = {"x-nxopen-api-key": api_key}
+    session = get_session()
+    last_error = ""
+
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire()
+
+        wait = None
+        try:
+            resp = session.get(url, headers=headers, params=params, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            last_error = f"連線錯誤: {e}"
+        else:
+            if resp.status_code == 200:
+                return OK, resp.json()
+            error_name = _error_name(resp)
+            error_text = f"HTTP {resp.status_code}" + (f" {error_name}" if error_name else "")
+            if error_name in NOT_FOUND_ERRORS:
+                return NOT_FOUND, error_text
+            if resp.status_code not in RETRY_STATUS:
+                return FAILED, error_text
+            last_error = error_text
+            wait = _retry_after_seconds(resp)
+
+        if attempt == MAX_RETRIES:
+            break
+        if wait is None:
+            wait = BACKOFF_BASE * (2 ** attempt)
+        time.sleep(min(wait, BACKOFF_MAX))
+
+    return FAILED, last_error
+
+def get_character_basic(name, api_key, limiter=None, date=None):
+    """暱稱 -> 角色基本資料，回傳 (狀態, JSON 或錯誤訊息)
+    OCID 先查本機快取；快取的 OCID 查不到基本資料 (改名或刪角) 就清掉並重查一次
+    """
+    params = {"date": date} if date else {}
+
+    ocid = api_cache.get_ocid(name)
+    from_cache = ocid is not None
+
+    for _ in range(2):
+        if not ocid:
+            status, data = get_json("/id", {"character_name": name}, api_key, limiter)
+            if status != OK:
+                return status, data
+            ocid = data.get("ocid")
+            if not ocid:
+                return NOT_FOUND, "查無 OCID"
+            api_cache.set_ocid(name, ocid)
+
+        status, data = get_json("/character/basic", {"ocid": ocid, **params}, api_key, limiter)
+        if status != NOT_FOUND:
+            return status, data
+
+        # 只有「確定查不到」才讓 OCID 失效；429 / 5xx 不動快取
+        api_cache.invalidate_ocid(name)
+        if not from_cache:
+            break
+        ocid, from_cache = None, False
+
+    return NOT_FOUND, data
+
+
+_refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def _fetch_and_store(name, api_key, limiter=None, date=None, remember_failure=True):
+    status, data = get_character_basic(name, api_key, limiter, date)
+    # 背景更新失敗時不記失敗，保留原本的舊資料
+    if status in (OK, NOT_FOUND) or remember_failure:
+        api_cache.set_character(name, status, data if status == OK else None)
+    return status, data
+
+def _refresh_in_background(name, api_key, limiter=None, date=None):
+    # 同一個角色同時只排一次背景更新
+    with _refreshing_lock:
+        if name in _refreshing:
+            return
+        _refreshing.add(name)
+
+    def task():
+        try:
+            _fetch_and_store(name, api_key, limiter, date, remember_failure=False)
+        except Exception:
+            pass
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(name)
+
+    _refresh_executor.submit(task)
+
+def peek_character_basic(name, api_key, limiter=None, date=None):
+    """只看本機快取、不等 API：有可用的結果回傳 (狀態, JSON 或錯誤訊息)，需要重新查詢回傳 None
+    - 超過 CHARACTER_FRESH_SECONDS 的舊資料照樣回傳，同時在背景重新查詢
+    - 「查無角色」在 NEGATIVE_TTL 內、「暫時失敗」在 FAILED_TTL 內直接回傳，不重複浪費 API 額度
+    """
+    cached = api_cache.get_character(name)
+    if not cached:
+        return None
+    status, data, fetched_at = cached
+    age = time.time() - fetched_at
+    if status == OK:
+        if age > CHARACTER_FRESH_SECONDS:
+            _refresh_in_background(name, api_key, limiter, date)
+        return status, data
+    if status == NOT_FOUND and age < NEGATIVE_TTL:
+        return status, "查無角色 (快取)"
+    if status == FAILED and age < FAILED_TTL:
+        return status, "稍早查詢失敗 (快取)"
+    return None
+
+def get_character_basic_cached(name, api_key, limiter=None, date=None):
+    """角色基本資料 (本機 SQLite 快取，所有 session / worker 共用)，回傳 (狀態, JSON 或錯誤訊息)
+    快取規則見 peek_character_basic；沒有可用的快取才同步查詢
+    """
+    cached = peek_character_basic(name, api_key, limiter, date)
+    if cached is not None:
+        return cached
+    return _fetch_and_store(name, api_key, limiter, date)
+
+
+class Prefetcher:
+    """背景並行查詢：同一個 key 正在查的話共用同一個 future，多人同時瀏覽也不會重複打 API"""
+
+    def __init__(self, fn, max_workers):
+        self.fn = fn
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def _done(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def submit(self, keys):
+        """排入查詢，回傳 {key: future}"""
+        futures = {}
+        with self.lock:
+            for key in keys:
+                future = self.pending.get(key)
+                if future is None:
+                    future = self.executor.submit(self.fn, key)
+                    self.pending[key] = future
+                    future.add_done_callback(lambda f, k=key: self._done(k, f))
+                futures[key] = future
+        return futures
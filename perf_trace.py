@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# ================= 設定區 =================
+PROFILE_LOG_DIR = os.environ.get("GUILD_PROFILE_LOG_DIR", "profile_logs")   # 每個 session 一個 .jsonl
+PROFILE_ENABLED = os.environ.get("GUILD_PROFILE", "1") != "0"                # 設成 0 就不寫紀錄檔
+# =========================================
+
+_write_lock = threading.Lock()
+
+
+class RerunProfiler:
+    """記錄一次 Streamlit 重新執行 (rerun) 中各階段花的時間
+
+    用法：
+        profiler = RerunProfiler(session_id)
+        with profiler.span("load_data"):
+            ...
+        record = profiler.finish()   # 寫入 profile_logs/<session_id>.jsonl
+    同名的區段出現多次會累加時間與次數。
+    """
+
+    def __init__(self, session_id, log_dir=PROFILE_LOG_DIR, enabled=PROFILE_ENABLED):
+        self.session_id = session_id
+        self.log_dir = log_dir
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = {}     # 名稱 -> [累計毫秒, 次數]
+        self.order = []     # 第一次出現的順序 (面板依執行順序顯示)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if name not in self.spans:
+                self.spans[name] = [0.0, 0]
+                self.order.append(name)
+            self.spans[name][0] += elapsed_ms
+            self.spans[name][1] += 1
+
+    def total_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def rows(self):
+        """[{區段, 毫秒, 次數, 佔比(%)}]，依執行順序排列"""
+        total = max(self.total_ms(), 1e-6)
+        return [
+            {'區段': name, '毫秒': round(self.spans[name][0], 2), '次數': self.spans[name][1],
+             '佔比': round(self.spans[name][0] / total * 100, 1)}
+            for name in self.order
+        ]
+
+    def finish(self, **extra):
+        """結束這次 rerun：回傳紀錄並 (啟用時) 附加到該 session 的 JSONL 檔"""
+        record = {
+            'ts': round(self.started_at, 3),
+            'session': self.session_id,
+            'total_ms': round(self.total_ms(), 2),
+            'spans': {name: {'ms': round(ms, 2), 'count': count} for name, (ms, count) in self.spans.items()},
+            **extra,
+        }
+        if self.enabled:
+            try:
+                os.makedirs(self.log_dir, exist_ok=True)
+                path = os.path.join(self.log_dir, f"{self.session_id}.jsonl")
+                with _write_lock, open(path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+        return record
@@ -1,58 +1,100 @@
 import pandas as pd
 import os
+import argparse
+import guild_store
+import guild_db
 
 # ================= 設定區 =================
 ORIGINAL_EXCEL = "data.xlsx"       # 您原本手動紀錄的檔案 (有正確職業)
 CURRENT_CSV = "guild_data.csv"     # 剛剛跑出來的檔案 (有等級圖片，但職業可能有缺)
 # =========================================
 
+# 判斷標準：CSV 裡的職業是這些值，就當作「缺資料」
+MISSING_JOB_VALUES = ["未知", "nan", "None", ""]
+
+def build_job_map(df_excel):
+    """建立「暱稱 -> 舊職業」的對照表 (Series)
+    如果 Excel 裡有重複暱稱，我們抓最後一筆資料即可；空白職業不列入
+    """
+    jobs = df_excel['職業'].fillna("").astype(str).str.strip()
+    job_map = pd.Series(jobs.values, index=df_excel['暱稱'].values)
+    job_map = job_map[~job_map.index.duplicated(keep='last')]
+    return job_map[~job_map.isin(["nan", ""])]
+
+def repair_jobs(df_csv, job_map):
+    """一次把所有缺職業的列補上 Excel 裡的職業，回傳 (修補後的資料, 修正筆數)"""
+    current_job = df_csv['職業'].astype(str).str.strip()
+    missing = current_job.isin(MISSING_JOB_VALUES) | df_csv['職業'].isna()
+
+    # 用暱稱去對照表查職業 (查不到會是 NaN)
+    original_job = df_csv['暱稱'].map(job_map)
+    fix_mask = missing & original_job.notna()
+
+    df_csv = df_csv.copy()
+    if fix_mask.any():
+        df_csv['職業'] = df_csv['職業'].astype(object)
+        df_csv.loc[fix_mask, '職業'] = original_job[fix_mask]
+    return df_csv, int(fix_mask.sum())
+
+def repair_file(csv_path, job_map):
+    """修補單一 CSV 並存檔，回傳修正筆數；讀不到檔案回傳 None"""
+    if not os.path.exists(csv_path):
+        print(f"❌ 找不到 {csv_path}，請先確認您剛剛有執行過 update_tool.py")
+        return None
+
+    try:
+        df_csv = pd.read_csv(csv_path) # 這是網站要用的
+    except Exception as e:
+        print(f"❌ 讀取 {csv_path} 失敗: {e}")
+        return None
+
+    df_csv, updated_count = repair_jobs(df_csv, job_map)
+    df_csv.to_csv(csv_path, index=False, encoding='utf-8-sig')
+
+    # 網站優先讀 Parquet，修補後也要一起更新，不然會讀到舊資料
+    # (其他快照只有在旁邊本來就有 Parquet 時才一起更新)
+    columnar_path = os.path.splitext(csv_path)[0] + ".parquet"
+    if os.path.abspath(csv_path) == os.path.abspath(CURRENT_CSV) or os.path.exists(columnar_path):
+        guild_store.write_columnar(df_csv, columnar_path)
+    # 資料庫模式：guild_data.db 存在的話也一起更新
+    if os.path.abspath(csv_path) == os.path.abspath(CURRENT_CSV) and os.path.exists(guild_db.DB_FILE):
+        guild_db.write_database(df_csv, guild_db.DB_FILE)
+    # 分割模式：只有內容有變的分割會重寫
+    manifest = guild_store.load_partition_manifest()
+    if os.path.abspath(csv_path) == os.path.abspath(CURRENT_CSV) and manifest:
+        guild_store.write_partitions(df_csv, by=manifest.get('by', guild_store.PARTITION_BY))
+
+    print(f"✅ {csv_path}：共 {len(df_csv)} 筆，修正了 {updated_count} 筆職業資料。")
+    return updated_count
+
 def main():
-    print("🔧 開始進行職業資料修補 (不消耗 API)...")
+    parser = argparse.ArgumentParser(description="用 Excel 裡的職業修補 CSV (不消耗 API)")
+    parser.add_argument("csv_files", nargs="*", default=[CURRENT_CSV],
+                        help=f"要修補的 CSV，可一次指定多個 (預設 {CURRENT_CSV})")
+    parser.add_argument("--excel", default=ORIGINAL_EXCEL, help=f"職業對照來源 (預設 {ORIGINAL_EXCEL})")
+    args = parser.parse_args()
 
-    # 1. 讀取兩個檔案
-    if not os.path.exists(CURRENT_CSV):
-        print(f"❌ 找不到 {CURRENT_CSV}，請先確認您剛剛有執行過 update_tool.py")
-        return
+    print("🔧 開始進行職業資料修補 (不消耗 API)...")
 
+    # 1. 讀取 Excel (與 update_tool 共用解析快取)，建立對照表
     try:
-        df_csv = pd.read_csv(CURRENT_CSV) # 這是網站要用的
-        df_excel = pd.read_excel(ORIGINAL_EXCEL) # 這是原本的備份
-        
-        print(f"📖 讀取完成：CSV ({len(df_csv)} 筆), Excel ({len(df_excel)} 筆)")
+        df_excel = guild_store.read_source_excel(args.excel) # 這是原本的備份
+        print(f"📖 讀取完成：Excel ({len(df_excel)} 筆)")
     except Exception as e:
         print(f"❌ 讀取檔案失敗: {e}")
         return
 
-    # 2. 建立一個「暱稱 -> 舊職業」的對照表
-    # 如果 Excel 裡有重複暱稱，我們抓最後一筆資料即可
-    # 這裡確保 '職業' 轉成字串，並去除前後空白
-    df_excel['職業'] = df_excel['職業'].fillna("").astype(str).str.strip()
-    job_map = df_excel.set_index('暱稱')['職業'].to_dict()
-
-    # 3. 開始修補 CSV 裡的職業
-    updated_count = 0
-    
-    for index, row in df_csv.iterrows():
-        name = row['暱稱']
-        current_job = str(row['職業']).strip()
-        
-        # 判斷標準：如果 CSV 裡的職業是 "未知"、"nan"、"None" 或是空白
-        # 就去 Excel 的對照表找
-        if current_job in ["未知", "nan", "None", "", "nan"]:
-            original_job = job_map.get(name)
-            
-            # 如果 Excel 裡找得到這個人，而且職業不是空的
-            if original_job and original_job not in ["nan", ""]:
-                df_csv.at[index, '職業'] = original_job
-                updated_count += 1
-                # print(f"修補成功: {name} -> {original_job}") # 想看詳細可以取消註解
-
-    # 4. 存檔覆蓋回去
-    df_csv.to_csv(CURRENT_CSV, index=False, encoding='utf-8-sig')
-    
+    job_map = build_job_map(df_excel)
+
+    # 2. 逐一修補每個 CSV (每個檔案內部是一次性的向量化處理)
+    results = {}
+    for csv_path in args.csv_files:
+        results[csv_path] = repair_file(csv_path, job_map)
+
     print("-" * 30)
-    print(f"✅ 修補完成！共修正了 {updated_count} 位成員的職業資料。")
-    print(f"💾 檔案已更新至 {CURRENT_CSV}，現在可以上傳到 GitHub 了。")
+    repaired = {path: count for path, count in results.items() if count is not None}
+    print(f"✅ 修補完成！{len(repaired)}/{len(results)} 個檔案，共修正了 {sum(repaired.values())} 筆職業資料。")
+    print("💾 檔案已更新，現在可以上傳到 GitHub 了。")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
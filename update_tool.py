@@ -1,7 +1,13 @@
 import pandas as pd
-import requests
 import time
 import os
+import argparse
+import api_cache
+import nexon_client
+import guild_store
+import guild_db
+import image_store
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ================= 設定區 =================
 # 請將這裡換成您的 NEXON API KEY
@@ -10,70 +16,163 @@ API_KEY = "test_610de0b1b6fc24f5d76920c0cc30d8f1901f340686cafe9296eed000958263ab
 # 檔案名稱設定
 INPUT_FILE = "data.xlsx"       # 您手動輸入的 Excel 檔名
 OUTPUT_FILE = "guild_data.csv" # 程式會自動產生的檔名 (給網站用)
+COLUMNAR_FILE = guild_store.COLUMNAR_FILE # 網站優先讀取的 Parquet 檔
+DATABASE_FILE = guild_db.DB_FILE # 選用的 SQLite 資料庫 (加上 --database 才會輸出)
+PARTITION_DIR = guild_store.PARTITION_DIR # 依日期分割的資料夾 (加上 --partitions 才會輸出)
+
+# API 速率設定 (官方限制每秒 5 次)
+RATE_LIMIT_PER_SEC = 5         # 每秒最多發出幾次請求
+MAX_WORKERS = 8                # 同時查詢的執行緒數量
+
+# 增量更新設定 (python update_tool.py --mode incremental)
+STALE_HOURS = 24               # 超過幾小時沒更新就算過期
+ACTIVE_WEEKS = 4               # 最近幾個「周次」有出現的成員才算活躍
 # =========================================
 
+# 所有執行緒共用同一個限速器 (容量 1 = 請求平均分散，不會瞬間爆量)
+rate_limiter = nexon_client.TokenBucket(RATE_LIMIT_PER_SEC, capacity=1)
+
 def get_character_info(name):
-    """輸入暱稱，回傳 (OCID, 等級, 職業, 圖片網址)"""
-    headers = {
-        "x-nxopen-api-key": API_KEY,
-        "accept": "application/json"
-    }
-    
+    """輸入暱稱，回傳 (狀態, {等級, 職業, 圖片})
+    狀態為 nexon_client 的 OK / NOT_FOUND / FAILED，只有 OK 時才有資料
+    """
     try:
-        # 1. 查 OCID
-        url_id = "https://open.api.nexon.com/maplestorytw/v1/id"
-        r_id = requests.get(url_id, headers=headers, params={"character_name": name})
-        
-        if r_id.status_code != 200:
-            return None # 查無此人
-            
-        ocid = r_id.json().get("ocid")
-        
-        # 2. 查基本資料
-        # 這裡會抓「昨天」的資料，因為官方 API 有時會有延遲
-        url_basic = "https://open.api.nexon.com/maplestorytw/v1/character/basic"
-        r_basic = requests.get(url_basic, headers=headers, params={"ocid": ocid})
-        
-        if r_basic.status_code == 200:
-            data = r_basic.json()
-            return {
-                "等級": data.get("character_level"),
-                "職業": data.get("character_class"),
-                "圖片": data.get("character_image")
-            }
+        # OCID 先查本機快取，再查基本資料 (連線共用、失敗自動重試)
+        status, data = nexon_client.get_character_basic(name, API_KEY, limiter=rate_limiter)
     except Exception as e:
         print(f"查詢錯誤 {name}: {e}")
-    
-    return None
+        return nexon_client.FAILED, None
+
+    if status != nexon_client.OK:
+        return status, None
+    return status, {
+        "等級": data.get("character_level"),
+        "職業": data.get("character_class"),
+        "圖片": data.get("character_image")
+    }
+
+def fetch_all_members(names):
+    """並行查詢所有成員，回傳 {暱稱: (狀態, 資料)}；每位成員仍是先查 OCID 再查基本資料"""
+    member_info_map = {}
+    total = len(names)
+    if total == 0:
+        return member_info_map
+
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(get_character_info, name): name for name in names}
+        for done, future in enumerate(as_completed(futures), start=1):
+            name = futures[future]
+            member_info_map[name] = future.result()
+
+            elapsed = time.monotonic() - start_time
+            speed = done / elapsed if elapsed > 0 else 0
+            print(f"[{done}/{total}] 更新: {name} ... ({speed:.1f} 人/秒)", end="\r")
+
+    elapsed = max(time.monotonic() - start_time, 1e-6)
+    print(f"\n⏱️ 共 {total} 人，耗時 {elapsed:.1f} 秒 (平均 {total / elapsed:.2f} 人/秒)")
+    return member_info_map
+
+def select_incremental_members(df, unique_members, existing_info):
+    """增量模式：只挑出需要重新查詢的成員
+    - 還沒有任何資料的新成員，或從來沒查詢成功過的成員 (上次 API 暫時失敗)
+    - 最近 ACTIVE_WEEKS 個周次有出現，且超過 STALE_HOURS 沒更新的成員
+    很久沒出現的成員直接沿用舊資料；查無角色 (職業=未知) 的成員也一樣套用上面的規則，不會每次都重查
+    """
+    weeks = pd.to_datetime(df['周次'], errors='coerce').dropna().drop_duplicates().sort_values()
+    recent_weeks = set(weeks.tail(ACTIVE_WEEKS))
+    active_members = set(df.loc[pd.to_datetime(df['周次'], errors='coerce').isin(recent_weeks), '暱稱'])
+
+    fetch_times = api_cache.get_fetch_times(unique_members)
+    stale_before = time.time() - STALE_HOURS * 3600
+
+    targets = []
+    for name in unique_members:
+        if name not in existing_info or name not in fetch_times:
+            targets.append(name)
+        elif name in active_members and fetch_times.get(name, 0) < stale_before:
+            targets.append(name)
+    return targets
+
+def load_existing_info(path):
+    """從上次輸出的 CSV 取出每位成員的 等級 / 職業 / 圖片"""
+    if not os.path.exists(path):
+        return {}
+    old_df = pd.read_csv(path)
+    cols = [c for c in ['等級', '職業', '圖片'] if c in old_df.columns]
+    if '暱稱' not in old_df.columns or not cols:
+        return {}
+    # 上次查無角色的人 (職業=未知) 也算有資料，要不要重查交給 select_incremental_members 判斷
+    latest = old_df.drop_duplicates(subset='暱稱', keep='last').set_index('暱稱')[cols]
+    return latest.to_dict(orient='index')
+
+def excel_job_map(df):
+    """Excel 裡每位成員最後一筆有填的職業 (API 查詢失敗又沒有舊資料時的備援)"""
+    if '職業' not in df.columns:
+        return {}
+    jobs = df[['暱稱', '職業']].dropna(subset=['職業'])
+    jobs = jobs[jobs['職業'].astype(str).str.strip() != ""]
+    return jobs.drop_duplicates(subset='暱稱', keep='last').set_index('暱稱')['職業'].to_dict()
 
 def main():
+    parser = argparse.ArgumentParser(description="更新公會成員的等級、職業與圖片")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full",
+                        help="full = 重新查詢所有成員；incremental = 只查過期或新加入的活躍成員")
+    parser.add_argument("--skip-images", action="store_true", help="不要同步角色圖片到本機圖庫")
+    parser.add_argument("--database", action="store_true",
+                        help="另外輸出有索引的 SQLite 資料庫 (網站設定 GUILD_BACKEND = \"sqlite\" 時使用)")
+    parser.add_argument("--partitions", choices=["month", "quarter"], default=None,
+                        help="另外輸出依月 / 季分割的資料 (網站設定 GUILD_BACKEND = \"partitioned\" 時使用)")
+    args = parser.parse_args()
+
     print("🚀 啟動更新小幫手...")
     print(f"📖 正在讀取 {INPUT_FILE}...")
     
     try:
         # 讀取原本的 Excel
-        df = pd.read_excel(INPUT_FILE)
+        df = guild_store.read_source_excel(INPUT_FILE)
         
         # 為了省流量，我們先找出「不重複」的名單
         # 假設 Excel 有 1000 行，但只有 50 個公會成員，我們只要查這 50 人
         unique_members = df['暱稱'].unique()
-        print(f"🔍 發現共 {len(unique_members)} 位成員，開始更新資料...")
-        
-        # 建立一個字典來存這些人的最新資料
-        member_info_map = {}
+
+        # 上次輸出的資料：增量模式的基礎，也是 API 暫時失敗時的備援
+        existing_info = load_existing_info(OUTPUT_FILE)
+
+        if args.mode == "incremental":
+            member_info_map = dict(existing_info)
+            targets = select_incremental_members(df, unique_members, member_info_map)
+            print(f"🔍 共 {len(unique_members)} 位成員，其中 {len(targets)} 位需要更新 (增量模式)...")
+        else:
+            member_info_map = {}
+            targets = list(unique_members)
+            print(f"🔍 發現共 {len(unique_members)} 位成員，開始更新資料...")
         
-        for i, name in enumerate(unique_members):
-            print(f"[{i+1}/{len(unique_members)}] 更新: {name} ...", end="\r")
-            
-            info = get_character_info(name)
-            if info:
+        # 多執行緒同時查詢，由限速器控制在每秒 5 次以內
+        fetched = fetch_all_members(targets)
+        # 查詢成功和查無角色都記錄時間 (暫時失敗不記，下次執行會再重試)
+        api_cache.mark_fetched([name for name, (status, _) in fetched.items() if status in (nexon_client.OK, nexon_client.NOT_FOUND)])
+
+        excel_jobs = excel_job_map(df)
+        failed = []
+        for name, (status, info) in fetched.items():
+            if status == nexon_client.OK:
                 member_info_map[name] = info
-            else:
-                # 查不到 (可能改名或刪角)，就給空值
+            elif status == nexon_client.NOT_FOUND:
+                # 查無此人 (可能改名或刪角)，就給空值
                 member_info_map[name] = {"等級": 0, "職業": "未知", "圖片": ""}
-            
-            # 重要：休息 0.2 秒，避免被鎖 IP (每秒限制 5 次)
-            time.sleep(0.2)
+            else:
+                # API 忙碌或連線失敗：沿用舊資料，不要寫成「未知」
+                failed.append(name)
+                if name in existing_info:
+                    member_info_map[name] = existing_info[name]
+                elif name not in member_info_map:
+                    # 沒有舊資料 (例如第一次執行)：先用 Excel 自己的職業，沒有就寫「未知」
+                    # 一定要有職業，不然網站整理資料時會把這位成員的每一周都丟掉
+                    member_info_map[name] = {"等級": 0, "職業": excel_jobs.get(name, "未知"), "圖片": ""}
+
+        if failed:
+            print(f"\n⚠️ 有 {len(failed)} 位成員因 API 忙碌或連線問題查詢失敗，已沿用上次的資料 (沒有舊資料的先用 Excel 的職業，下次執行會再重試)")
             
         print("\n✅ API 資料查詢完畢！正在合併資料...")
         
@@ -90,10 +189,30 @@ def main():
         # 3. 合併 (Left Join)
         # 這會把最新的等級、圖片，填入 Excel 的每一行對應的名字後面
         final_df = pd.merge(df, info_df, on='暱稱', how='left')
+        # 保險：任何沒對到資料的成員都不能讓職業留空 (空職業的列會被網站整個排除)
+        if '職業' in final_df.columns:
+            final_df['職業'] = final_df['職業'].fillna("未知")
         
         # 4. 存檔
         final_df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
         print(f"💾 檔案已輸出至: {OUTPUT_FILE}")
+        if guild_store.write_columnar(final_df, COLUMNAR_FILE):
+            print(f"💾 型別化資料已輸出至: {COLUMNAR_FILE}")
+        if args.database or os.path.exists(DATABASE_FILE):
+            # 已經在用資料庫模式的話，每次更新都要一起重寫，不然網站會讀到舊資料
+            guild_db.write_database(final_df, DATABASE_FILE)
+            print(f"💾 資料庫已輸出至: {DATABASE_FILE}")
+        manifest = guild_store.load_partition_manifest(PARTITION_DIR)
+        if args.partitions or manifest:
+            # 內容沒變的分割 (舊賽季) 不會重寫
+            written, total = guild_store.write_partitions(final_df, PARTITION_DIR, args.partitions or manifest.get('by', guild_store.PARTITION_BY))
+            print(f"💾 分割資料已輸出至: {PARTITION_DIR} (共 {total} 個分割，更新 {written} 個)")
+
+        # 5. 角色圖片存到本機圖庫 (內容相同只存一份，ETag 沒變就不重抓)
+        if not args.skip_images:
+            print("🖼️ 正在同步角色圖片...")
+            counts = image_store.sync_images(final_df['圖片'].dropna().unique())
+            print(f"🖼️ 圖片同步完成：新下載 {counts['downloaded']}、未變更 {counts['unchanged']}、失敗 {counts['failed']}")
         print("🎉 網站資料庫更新完成！")
 
     except Exception as e: